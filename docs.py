@@ -126,7 +126,7 @@ def describe_class(cls,output,level=1):
       argdesc.extend(args)
       i = len(argdesc)-1
       while defaults:
-        argdesc[i] += ('=%r' % defaults.pop(-1))
+        argdesc[i] += ('=%r' % (defaults.pop(-1),))
         i -= 1
 
       if vargs:
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+'''Micro-benchmarks for the observer module.
+
+Measures property access throughput with varying numbers of observers, instance construction,
+observer registration and removal as the registry grows, memory per registered instance and
+threaded (`use_thread`) dispatch throughput. Results are written as JSON so that runs from
+different versions can be compared:
+
+    python benchmark.py -o before.json
+    ... change things ...
+    python benchmark.py -o after.json --compare before.json
+'''
+from __future__ import with_statement
+
+__all__ = ['run','compare']
+
+import sys,os,gc,json,time,platform
+from timeit import default_timer as _timer
+
+import observer
+from observer import Observable,observed,add_observer,remove_all_observers
+
+class _Model(object):
+  __metaclass__ = Observable
+
+  def __init__(self,value=0):
+    self._value = value
+
+  @observed
+  def value(self): return self._value
+
+  @value.setter
+  def value(self,value): self._value = value
+
+  @value.deleter
+  def value(self): self._value = None
+
+class _Plain(object):
+  def __init__(self,value=0):
+    self._value = value
+
+class _SlottedModel(object):
+  __metaclass__ = Observable
+  __slots__ = ('_value',)
+
+  def __init__(self,value=0):
+    self._value = value
+
+  @observed
+  def value(self): return self._value
+
+class _SlottedPlain(object):
+  __slots__ = ('_value',)
+
+  def __init__(self,value=0):
+    self._value = value
+
+def _noop(*args): pass
+
+def _rate(func,number):
+  gc.collect()
+  start = _timer()
+  func(number)
+  elapsed = _timer() - start
+  return number / elapsed if elapsed > 0 else float('inf')
+
+def _rss():
+  try:
+    with open('/proc/self/statm') as f:
+      return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except (IOError,OSError,ValueError):
+    return None
+
+def bench_access(number):
+  '''get/set/del operations per second on a single object with 0, 1, 10 and 100 observers.'''
+  results = {}
+  for count in (0,1,10,100):
+    ob = _Model()
+    name = 'bench_access_%d' % count
+    for i in xrange(count):
+      for t in ('get','set','del'):
+        add_observer(ob,'value',lambda *args: None,t,name=name)
+    def get(n):
+      for i in xrange(n):
+        ob.value
+    def set(n):
+      for i in xrange(n):
+        ob.value = i
+    def delete(n):
+      for i in xrange(n):
+        del ob.value
+    results[str(count)] = {'get':_rate(get,number),
+                           'set':_rate(set,number),
+                           'del':_rate(delete,number)}
+    remove_all_observers(name)
+  return results
+
+def bench_construct(number):
+  '''Instances constructed per second, Observable versus a plain class.'''
+  def observable(n):
+    for i in xrange(n):
+      _Model(i)
+  def plain(n):
+    for i in xrange(n):
+      _Plain(i)
+  return {'observable':_rate(observable,number),'plain':_rate(plain,number)}
+
+def bench_registry(sizes,repeat=100):
+  '''Average add_observer and remove_all_observers latency in seconds, by the number of
+  registered objects.
+  '''
+  results = {}
+  for size in sizes:
+    obs = [_Model(i) for i in xrange(size)]
+    for ob in obs:
+      add_observer(ob,'value',_noop,name='bench_registry')
+    target = obs[size // 2]
+    gc.collect()
+    start = _timer()
+    for i in xrange(repeat):
+      add_observer(target,'value',_noop,'set',name='bench_registry_%d' % i)
+    add_object = (_timer() - start) / repeat
+    start = _timer()
+    for i in xrange(repeat):
+      add_observer('bench_registry_name_%d' % i,'value',_noop,name='bench_registry_%d' % i)
+    add_name = (_timer() - start) / repeat
+    start = _timer()
+    for i in xrange(repeat):
+      remove_all_observers('bench_registry_%d' % i)
+    remove = (_timer() - start) / repeat
+    start = _timer()
+    remove_all_observers('bench_registry')
+    remove_all = _timer() - start
+    results[str(size)] = {'add_observer(object)':add_object,
+                          'add_observer(name)':add_name,
+                          'remove_all_observers':remove,
+                          'remove_all_observers(all objects)':remove_all}
+    del obs,target
+  gc.collect()
+  return results
+
+def _registered(i):
+  ob = _Model(i)
+  add_observer(ob,'value',_noop,name='bench_memory')
+  return ob
+
+_MEMORY_FACTORIES = {'plain':_Plain,
+                     'observable':_Model,
+                     'registered':_registered,
+                     'plain(slots)':_SlottedPlain,
+                     'observable(slots)':_SlottedModel}
+
+def _measure_memory(name,number):
+  factory = _MEMORY_FACTORIES[name]
+  gc.collect()
+  before = _rss()
+  obs = [factory(i) for i in xrange(number)]
+  after = _rss()
+  if before is None or after is None:
+    return None
+  return float(after - before) / number
+
+def bench_memory(number):
+  '''Bytes per instance for plain objects, unobserved Observable objects, Observable objects
+  with an observer of their own and plain and Observable classes using __slots__ (based on
+  process RSS, None where unavailable). Each is measured in a fresh interpreter, otherwise
+  memory freed by whatever ran before is reused and the process doesn't grow.
+  '''
+  import subprocess
+  code = 'import sys,json,benchmark; print json.dumps(benchmark._measure_memory(sys.argv[1],int(sys.argv[2])))'
+  results = {}
+  for name in _MEMORY_FACTORIES:
+    output = subprocess.check_output([sys.executable,'-c',code,name,str(number)],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+    results[name] = json.loads(output)
+  return results
+
+def bench_threaded(number):
+  '''set notifications per second delivered to a `use_thread` observer, including the time
+  taken for the executor to drain.
+  '''
+  ob = _Model()
+  add_observer(ob,'value',_noop,'set',name='bench_threaded',use_thread=True)
+  def set(n):
+    for i in xrange(n):
+      ob.value = i
+    observer.get_executor().drain()
+  result = _rate(set,number)
+  remove_all_observers('bench_threaded')
+  return {'set':result}
+
+def run(quick=False):
+  '''Runs every benchmark, returning the results as a dict.'''
+  scale = quick and 10 or 1
+  return {'meta':{'python':platform.python_version(),
+                  'platform':platform.platform(),
+                  'time':time.time(),
+                  'quick':bool(quick)},
+          'access':bench_access(200000 // scale),
+          'construct':bench_construct(200000 // scale),
+          'registry':bench_registry(quick and (100,1000,10000) or (100,1000,10000,100000)),
+          'memory':bench_memory(100000 // scale),
+          'threaded':bench_threaded(50000 // scale)}
+
+def _flatten(results,prefix=''):
+  for key,value in sorted(results.iteritems()):
+    if isinstance(value,dict):
+      for item in _flatten(value,prefix + key + '/'):
+        yield item
+    elif isinstance(value,(int,long,float)) and not isinstance(value,bool):
+      yield prefix + key,value
+
+def compare(old,new):
+  '''Returns a list of (benchmark,old,new,ratio) tuples for every numeric result present in
+  both `old` and `new` (the 'meta' section is ignored). For rates, a ratio above 1 is an
+  improvement; for latencies and memory, a ratio below 1 is.
+  '''
+  old = dict(_flatten(dict((k,v) for k,v in old.iteritems() if k != 'meta')))
+  rows = []
+  for key,value in _flatten(dict((k,v) for k,v in new.iteritems() if k != 'meta')):
+    if key in old:
+      rows.append((key,old[key],value,old[key] and value / old[key] or None))
+  return rows
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser(description='observer micro-benchmarks')
+  parser.add_argument('-o','--output',help='write JSON results to this file instead of stdout')
+  parser.add_argument('--compare',metavar='FILE',help='compare against previously saved results')
+  parser.add_argument('--quick',action='store_true',help='run with smaller workloads')
+  args = parser.parse_args()
+
+  results = run(args.quick)
+  observer.shutdown()
+  if args.output:
+    with open(args.output,'w') as f:
+      json.dump(results,f,indent=2,sort_keys=True)
+  else:
+    json.dump(results,sys.stdout,indent=2,sort_keys=True)
+    sys.stdout.write('\n')
+  if args.compare:
+    with open(args.compare) as f:
+      previous = json.load(f)
+    for key,old,new,ratio in compare(previous,results):
+      sys.stderr.write('%-60s %14.6g %14.6g %8s\n' % (key,old,new,ratio and '%.2fx' % ratio or '-'))
+
+# vi: :set sts=2 sw=2 ai et tw=0:
@@ -6,16 +6,26 @@ back any interested parties who have registered handlers (callables) for the obs
 object's instance or class (new-style classes only).
 
 In order for this to work, observed objects must all use the `Observable` metaclass. This metaclass
-registered the class and any instantiated objects. Instantiated objects are referenced weakly
-only, so if the observed object is ever destroyed any registered observation callbacks
-are automatically released.
+registers the class. Instantiated objects are only registered once something observes them
+directly, and are referenced weakly only, so if the observed object is ever destroyed any
+registered observation callbacks are automatically released.
+
+Classes using `__slots__` are supported: the metaclass adds a `__weakref__` slot when no base
+class provides one, so instances stay as small as those of a plain slotted class (one pointer
+larger at most) and never need a `__dict__`.
 
 Callbacks happen pseudo-independantly from the property data being returned to the original
 requestor, being sent to the observed object's property handler for setting/deletion. Observers
 cannot modify the data in any way.
 
 Optionally, observers can be called in a separate thread by indicating this when they register
-to observe some class or object.
+to observe some class or object. Threaded observers share a bounded pool of worker threads
+(see `ObserverExecutor`). Observers can also be delivered on an asyncio (or trollius) event
+loop, including coroutine observers (see `add_observer` and `observe_stream`).
+
+Observers can be added and removed from any thread while notifications are being delivered in
+others. Changes to the registry are serialized on a lock, but notifications never wait for it:
+they see the observers registered at the moment they started.
 
 A metaclass that makes other classes suitable for observation (i.e. the targets of
 observation rather than the observers). This should be used in conjuction with the
@@ -38,16 +48,68 @@ Usage:
 
 See [add_observer](#add_observer) for the observer (client) side of things.
 '''
-__all__ = ['Observable','observed','add_observer','remove_all_observers','make_observable']
-
-import sys,weakref,inspect
+__all__ = ['Observable','observed','add_observer','add_observers','remove_all_observers',
+           'make_observable',
+           'ObserverExecutor','get_executor','set_executor','shutdown','ObserverStream',
+           'observe_stream','batch','ObserverStats','enable_instrumentation',
+           'disable_instrumentation','observer_stats','EventForwarder','EventReceiver',
+           'RemoteObject','Journal','computed','ObservableArray','ArrayChange','compact','registry_stats']
+
+import sys,weakref,inspect,traceback,operator
+from array import array
 from types import TypeType,ObjectType,InstanceType,ClassType
-from threading import Thread
+from threading import Thread,Lock,RLock,Condition,current_thread,local
+from collections import deque,OrderedDict
 from inspect import isfunction
+from functools import partial
+from itertools import count,islice,izip
+import time
+from time import time as _time
+from timeit import default_timer as _timer
+from bisect import bisect_right
+from heapq import heappush,heappop
+from Queue import Empty
+
+try:
+  import asyncio
+except ImportError:
+  try:
+    import trollius as asyncio
+  except ImportError:
+    asyncio = None
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
 
 _observed_names = dict()
 _observed_classes = dict()
 _observed_objects = dict()
+# number of observers registered anywhere for each property name, @observed properties
+# whose names are not in here skip dispatch entirely.
+_watched_properties = dict()
+# observed name -> the refs of every class and object registered under that name, and
+# registration name -> {id(observer sets): observer sets} for every set holding such observers.
+_refs_by_name = dict()
+_observersets_by_name = dict()
+# every change to the registries above is made holding this lock. Dispatch never takes it: the
+# observers of a property are an immutable tuple that writers replace rather than modify, and
+# the tuples of observer sets in _observed_classes and _observed_objects are replaced likewise.
+_registry_lock = RLock()
+# id(class) -> (generation,observer sets), the observer sets from the class and all of its
+# Observable bases that the class's instances notify. Built on first use, without the lock, and
+# discarded whenever class or name observers change, so dispatch never walks the MRO. Entries
+# built from an older generation of the registry are ignored.
+_class_dispatch = dict()
+_generations = count()
+_class_generation = next(_generations)
+# refs to destroyed classes and objects, removed from the registries in batches by _purge() on
+# the next change to the registries. Until then they stay registered but never compare equal to
+# a live object, so dispatch can't find them. Weak observers whose callback was destroyed are
+# queued here too, as (observer sets,type,property,ref); calling them does nothing meanwhile.
+_dead_refs = deque()
+_purged = 0
 
 class ObserverError(Exception): pass
 
@@ -77,17 +139,18 @@ class _Ref(weakref.KeyedRef):
     elif isinstance(ob,(InstanceType,ClassType)):
       raise ObserverError, 'old-style classes and instances are not supported by the observer protocol'
     else:
-      self._type = type(ob)
+      # not type(ob), a dead ref waiting to be purged mustn't keep the class alive.
+      self._type = ObjectType
     self._hash = _hash(ob)
     super(_Ref,self).__init__(ob,callback,name)
 
   def callback(self):
-    global _observed_objects, _observed_classes
-
+    # called during garbage collection, possibly while this thread is in the middle of changing
+    # the registries, so the actual cleanup is left to _purge().
     if self._type == TypeType:
-      del _observed_classes[self]
-    else:
-      del _observed_objects[self]
+      # a new class could reuse the dead one's id.
+      _invalidate_class_dispatch()
+    _dead_refs.append(self)
 
   def __hash__(self):
     return self._hash
@@ -95,24 +158,33 @@ class _Ref(weakref.KeyedRef):
   def __eq__(self,other):
     if isinstance(other,weakref.ref):
       #print 'EQ to REF',other
-      return self() is other()
+      # dead refs are only equal to themselves.
+      return self is other or (self() is other() and other() is not None)
     else:
       #print 'EQ to',other
       return self() is other
 
 class _CallbackWrapper(object):
-  __slots__ = ('property','type','use_thread','_func','_h')
+  __slots__ = ('property','type','use_thread','loop','batch','policy','filter','name','_func','_h')
 
-  def __init__(self,property,type,use_thread,func):
+  def __init__(self,property,type,use_thread,func,loop=None,batch=False,policy=None,filter=None,
+               name=_AnonymousKey):
     self.property = property
     self.type = type
     self.use_thread = use_thread
+    self.loop = loop
+    self.batch = batch
+    self.policy = policy
+    self.filter = filter
+    self.name = name
     self._func = func
     self._h = None
 
   def __call__(self,*args):
     #print 'CALLBACKWRAPPER, args:',repr(args)
-    return self._func(*args)
+    if _instrumentation is None:
+      return self._func(*args)
+    return _instrumentation.call(self,args)
 
   def __str__(self):
     return self.property
@@ -130,26 +202,349 @@ class _CallbackWrapper(object):
       return self.property == ob.property and self._func == ob._func
     return self._func == ob
 
-  def clone(self):
-    return type(self)(self.property,self.type,self.use_thread,self._func)
+class ObserverStats(object):
+  '''Runtime statistics for a single observer of a single property and access type, see
+  `enable_instrumentation()`. Latencies are in seconds.
+
+  * _calls_: number of times the observer was called.
+  * _errors_: number of those calls which raised an exception.
+  * _total_: cumulative latency.
+  * _max_: highest single latency.
+  * _histogram_: list of call counts, one per bucket; bucket `i` counts calls which took less
+    than `buckets[i]` seconds (and at least `buckets[i-1]`), the last bucket counts calls
+    slower than every bound.
+  '''
+  __slots__ = ('property','type','observer','buckets','calls','errors','total','max','histogram')
 
-def _merge_names(name,dest):
-  dest_get = dest['get']
-  dest_set = dest['set']
-  dest_delete = dest['del']
+  def __init__(self,property,type,observer,buckets):
+    self.property = property
+    self.type = type
+    self.observer = observer
+    self.buckets = buckets
+    self.calls = 0
+    self.errors = 0
+    self.total = 0.0
+    self.max = 0.0
+    self.histogram = [0] * (len(buckets) + 1)
 
-  if name in _observed_names:
-    observersets = _observed_names[name]
-    for n,observers in observersets['get'].iteritems():
-      dest_get.setdefault(n,set()).update(o.clone() for o in observers)
-    for n,observers in observersets['set'].iteritems():
-      dest_set.setdefault(n,set()).update(o.clone() for o in observers)
-    for n,observers in observersets['del'].iteritems():
-      dest_delete.setdefault(n,set()).update(o.clone() for o in observers)
+  @property
+  def mean(self):
+    return self.calls and self.total / self.calls or 0.0
+
+  def __repr__(self):
+    return '<ObserverStats %s %s %r: %d calls, %d errors, mean %.6fs, max %.6fs>' % (
+      self.type,self.property,self.observer,self.calls,self.errors,self.mean,self.max)
+
+  def copy(self):
+    stats = ObserverStats(self.property,self.type,self.observer,self.buckets)
+    stats.calls = self.calls
+    stats.errors = self.errors
+    stats.total = self.total
+    stats.max = self.max
+    stats.histogram = list(self.histogram)
+    return stats
+
+class _Instrumentation(object):
+  def __init__(self,threshold,hook,buckets):
+    self.threshold = threshold
+    self.hook = hook
+    self.buckets = buckets
+    self.stats = {}
+    self.lock = Lock()
+
+  def call(self,o,args):
+    start = _timer()
+    try:
+      result = o._func(*args)
+    except Exception:
+      self.record(o,_timer() - start,True)
+      raise
+    self.record(o,_timer() - start,False)
+    return result
+
+  def record(self,o,elapsed,error):
+    key = (o.property,o.type,o._func)
+    with self.lock:
+      stats = self.stats.get(key)
+      if stats is None:
+        self.stats[key] = stats = ObserverStats(o.property,o.type,o._func,self.buckets)
+      stats.calls += 1
+      stats.total += elapsed
+      if error:
+        stats.errors += 1
+      if elapsed > stats.max:
+        stats.max = elapsed
+      stats.histogram[bisect_right(self.buckets,elapsed)] += 1
+    if self.threshold is not None and elapsed >= self.threshold:
+      self.hook(o.property,o.type,o._func,elapsed)
+
+def _warn_slow_observer(property,type,observer,elapsed):
+  import warnings
+  warnings.warn('slow %s observer %r of %r took %.6f seconds' % (type,observer,property,elapsed))
+
+_instrumentation = None
+
+def enable_instrumentation(threshold=None,hook=None,
+                           buckets=(1e-6,1e-5,1e-4,1e-3,1e-2,1e-1,1.0)):
+  '''Starts collecting call counts, latencies and errors for every observer callback (see
+  `ObserverStats` and `observer_stats()`). Any statistics already collected are discarded.
+
+  If `threshold` is given, `hook(property,type,observer,elapsed)` is called every time an
+  observer takes at least `threshold` seconds; the default hook issues a warning. `buckets`
+  are the upper bounds, in seconds, of the latency histogram buckets.
+
+  Instrumentation is off by default, in which case it costs a single global lookup per call.
+  '''
+  global _instrumentation
+  _instrumentation = _Instrumentation(threshold,hook or _warn_slow_observer,
+                                      tuple(sorted(buckets)))
+
+def disable_instrumentation():
+  '''Stops collecting observer statistics and discards those already collected.'''
+  global _instrumentation
+  _instrumentation = None
+
+def observer_stats(property=None,type=None):
+  '''Returns a snapshot of the collected statistics as a list of `ObserverStats`, optionally
+  only those for `property` and/or access `type`. The list is empty if instrumentation
+  is not enabled.
+  '''
+  instrumentation = _instrumentation
+  if instrumentation is None:
+    return []
+  if type is not None:
+    type = type[:3]
+  with instrumentation.lock:
+    return [stats.copy() for stats in instrumentation.stats.itervalues()
+            if (property is None or stats.property == property) and
+               (type is None or stats.type == type)]
+
+class _WeakCallback(object):
+  '''Calls a callback which is only weakly referenced. Bound methods are supported by weakly
+  referencing the method's object.
+  '''
+  __slots__ = ('_ref','_func','_h','on_death')
+
+  def __init__(self,callback):
+    im_self = getattr(callback,'im_self',None)
+    if im_self is not None:
+      self._ref = weakref.ref(im_self,self._dead)
+      self._func = callback.im_func
+    else:
+      self._ref = weakref.ref(callback,self._dead)
+      self._func = None
+    self._h = hash(callback)
+    self.on_death = None
+
+  def _dead(self,ref):
+    if self.on_death is not None:
+      self.on_death(ref)
+
+  def resolve(self):
+    ob = self._ref()
+    if ob is None or self._func is None:
+      return ob
+    return self._func.__get__(ob,ob.__class__)
+
+  def __call__(self,*args):
+    callback = self.resolve()
+    if callback is not None:
+      return callback(*args)
+
+  def __repr__(self):
+    return '<weak %r>' % self.resolve()
+
+  def __hash__(self):
+    return self._h
+
+  def __eq__(self,other):
+    if isinstance(other,_WeakCallback):
+      return self._ref == other._ref and self._func is other._func
+    callback = self.resolve()
+    return callback is not None and callback == other
+
+  def __ne__(self,other):
+    return not self == other
+
+def _prune(observersets,type,property,ref):
+  # called when the callback of a weak observer has been destroyed, during garbage collection
+  # just like _Ref.callback, so the observer is only removed by _purge().
+  _dead_refs.append((observersets,type,property,ref))
+
+def _remove_weak(observersets,type,property,ref):
+  properties = observersets[type]
+  observers = properties.get(property)
+  if not observers:
+    return
+  live = tuple(o for o in observers
+               if not (isinstance(o._func,_WeakCallback) and o._func._ref is ref))
+  _replace(properties,property,observers,live)
+  _invalidate_class_dispatch()
+
+def _new_observersets():
+  # observer sets are indexed by access type and then by the observed property name, giving a
+  # tuple of observers; dispatch only ever touches the observers for a single property.
+  return {'get':{},'set':{},'del':{}}
+
+class _OwnObservers(dict):
+  '''The observer sets registered directly against a single class or object, as opposed to
+  those shared with it through a name.
+  '''
+  __slots__ = ()
+
+  def __init__(self):
+    super(_OwnObservers,self).__init__(_new_observersets())
+
+# Observable classes and objects map to a tuple of observer sets. Named observer sets are shared
+# by reference between every class and object of that name; a class or object only gets observer
+# sets of its own (always first in the tuple) once something observes it directly.
+def _shared_observersets(*names):
+  return tuple(_observed_names[n] for n in names if n in _observed_names)
+
+def _own_observersets(observed):
+  if observed and isinstance(observed[0],_OwnObservers):
+    return observed[0]
+
+def _watch(property,count=1):
+  count += _watched_properties.get(property,0)
+  if count > 0:
+    _watched_properties[property] = count
+  else:
+    _watched_properties.pop(property,None)
+
+class _Observers(tuple):
+  '''The observers of a single property. Dispatch just iterates it, writers also use `keys`, the
+  set of (registration name,observer) pairs, to find duplicates without comparing every one.
+  '''
+  def __new__(cls,observers=(),keys=None):
+    self = super(_Observers,cls).__new__(cls,observers)
+    if keys is None:
+      keys = frozenset((o.name,o) for o in self)
+    self.keys = keys
+    return self
+
+_no_observers = _Observers()
+
+def _replace(properties,property,observers,new,keys=None):
+  # swaps in new observers for a property, the old ones may still be in use by dispatch.
+  _watch(property,len(new) - len(observers))
+  if new:
+    properties[property] = _Observers(new,keys)
+  else:
+    properties.pop(property,None)
+
+def _release(observersets):
+  key = id(observersets)
+  for properties in observersets.values():
+    for property,observers in properties.items():
+      _watch(property,-len(observers))
+      for o in observers:
+        tables = _observersets_by_name.get(o.name)
+        if tables is not None:
+          tables.pop(key,None)
+          if not tables:
+            del _observersets_by_name[o.name]
+    # weak observers still referencing these sets mustn't account for them a second time.
+    properties.clear()
+
+def _purge():
+  # removes dead refs from the registries. The caller must hold _registry_lock.
+  global _purged
+  while _dead_refs:
+    ref = _dead_refs.popleft()
+    if isinstance(ref,tuple):
+      _remove_weak(*ref)
+      continue
+    if ref._type == TypeType:
+      observed = _observed_classes.pop(ref,None)
+    else:
+      observed = _observed_objects.pop(ref,None)
+    _unindex_ref(ref.key,ref)
+    if observed:
+      observers = _own_observersets(observed)
+      if observers is not None:
+        _release(observers)
+    _purged += 1
+
+def _index_ref(name,ref):
+  _refs_by_name.setdefault(name,set()).add(ref)
+
+def _unindex_ref(name,ref):
+  refs = _refs_by_name.get(name)
+  if refs is not None:
+    refs.discard(ref)
+    if not refs:
+      del _refs_by_name[name]
+
+def _add_wrappers(entries):
+  # adds a list of (observer sets,wrapper); each property's observers are replaced only once.
+  updates = {}
+  for observersets,wrapper in entries:
+    properties = observersets[wrapper.type]
+    key = (id(properties),wrapper.property)
+    update = updates.get(key)
+    if update is None:
+      observers = properties.get(wrapper.property,_no_observers)
+      updates[key] = update = (properties,wrapper.property,observers,list(observers),set())
+    name = wrapper.name
+    if (name,wrapper) in update[2].keys or (name,wrapper) in update[4]:
+      continue
+    update[3].append(wrapper)
+    update[4].add((name,wrapper))
+    if name is not _AnonymousKey:
+      _observersets_by_name.setdefault(name,{})[id(observersets)] = observersets
+  for properties,property,observers,new,added in updates.itervalues():
+    if added:
+      _replace(properties,property,observers,new,observers.keys | added)
+
+def _invalidate_class_dispatch():
+  # the new generation must be visible before the entries go, a tuple being built from the
+  # registry as it was is then stored with the old one.
+  global _class_generation
+  _class_generation = next(_generations)
+  _class_dispatch.clear()
+
+def _class_observersets(cls):
+  generation = _class_generation
+  entry = _class_dispatch.get(id(cls))
+  if entry is not None and entry[0] == generation:
+    return entry[1]
+  # built from the registry as it is right now; a writer changing it meanwhile moves on to a
+  # new generation, so the result is never used once stale.
+  seen = set()
+  flattened = []
+  for base in cls.__mro__:
+    for observersets in _observed_classes.get(base,()):
+      # observer sets without any observers are left out, adding one invalidates the cache.
+      if id(observersets) not in seen and any(observersets.itervalues()):
+        seen.add(id(observersets))
+        flattened.append(observersets)
+  observed = tuple(flattened)
+  _class_dispatch[id(cls)] = (generation,observed)
+  return observed
+
+def _observed_name(ob):
+  # the name observers can use to observe a class or object by.
+  name = getattr(ob,'__observed_name__',None)
+  if name is None:
+    if isinstance(ob,TypeType):
+      return ob.__full_name__
+    return repr(ob)
+  elif callable(name):
+    return name()
+  return name
 
 class Observable(type):
   '''See the observer module documentation.'''
   def __new__(cls,name,bases,dct):
+    slots = dct.get('__slots__')
+    if slots is not None:
+      if isinstance(slots,basestring):
+        slots = (slots,)
+      slots = tuple(slots)
+      # instances are referenced weakly once observed, slotted classes need to allow that.
+      if '__weakref__' not in slots and not any(getattr(b,'__weakrefoffset__',0) for b in bases):
+        dct['__slots__'] = slots + ('__weakref__',)
     for b in bases:
       if getattr(b,'__hash__',None) is _hash:
         return super(Observable,cls).__new__(cls,name,bases,dct)
@@ -180,49 +575,37 @@ class Observable(type):
 
   def __init__(cls,name,bases,dct):
     super(Observable,cls).__init__(name,bases,dct)
-    if hasattr(cls,'__observed_name__'):
-      oname = cls.__observed_name__
-      if callable(oname):
-        oname = oname()
-    else:
-      oname = cls.__full_name__
+    oname = _observed_name(cls)
     try:
       wr = _Ref(cls,oname)
     except TypeError:
       wr = cls
-    _observed_classes[wr] = observed = {'get':{},'set':{},'del':{}}
+    with _registry_lock:
+      if _dead_refs:
+        _purge()
+      _observed_classes[wr] = (_OwnObservers(),) + _shared_observersets(oname)
+      _index_ref(oname,wr)
+      _invalidate_class_dispatch()
     #print 'observable class:',wr()
-    _merge_names(oname,observed)
-    
-    old_init = dct.get('__init__')
-    def init(self,*args,**kwargs):
-      cls._register(self)
-      if old_init:
-        old_init(self,*args,**kwargs)
-      else:
-        super(cls,self).__init__(*args,**kwargs)
-    if old_init:
-      init.__dict__.update(old_init.__dict__)
-      init.__doc__ = old_init.__doc__
-      init.__name__ = old_init.__name__
-    else:
-      init.__name__ = '__init__'
-    cls.__init__ = init
 
   @classmethod
   def _register(cls,ob):
-    name = getattr(ob,'__observed_name__',None)
-    if name is None:
-      name = repr(ob)
-    elif callable(name):
-      name = name()
+    # objects are registered lazily, the first time something observes them directly.
+    name = _observed_name(ob)
     try:
       wr = _Ref(ob,name)
-      _observed_objects[wr] = observed = {'get':{},'set':{},'del':{}}
     except TypeError:
-      raise ObserverError,'objects of type %r cannot be observed' % cls
-    _merge_names(name,observed)
-    return ob
+      raise ObserverError,'objects of type %r cannot be observed' % ob.__class__
+    with _registry_lock:
+      # new objects often reuse a dead one's address, and so its hash.
+      if _dead_refs:
+        _purge()
+      # another thread may have got here first.
+      observed = _observed_objects.get(ob)
+      if observed is None:
+        _observed_objects[wr] = observed = _shared_observersets(name)
+        _index_ref(name,wr)
+    return observed
 
   @property
   def __full_name__(cls):
@@ -252,30 +635,560 @@ class Observable(type):
     return type(othermeta.__name__,(othermeta,cls),{})
 make_observable = Observable.make_observable
 
-def _observe_callback(observed,key,type,name,ob,*args):
+class _Worker(Thread):
+  def __init__(self,executor,index):
+    Thread.__init__(self,name='observer_worker_%d' % index)
+    self.setDaemon(True)
+    self.executor = executor
+    self.queue = deque()
+    self.cond = Condition(Lock())
+    self.busy = False
+    self.closed = False
+
+  def put(self,item):
+    executor = self.executor
+    queue = self.queue
+    with self.cond:
+      while len(queue) >= executor.maxsize and not self.closed:
+        if executor.policy == 'drop-oldest':
+          queue.popleft()
+          executor.dropped += 1
+        elif executor.policy == 'drop-newest':
+          executor.dropped += 1
+          return False
+        elif current_thread() is self:
+          # an observer notifying an observer on its own worker would wait forever.
+          break
+        else:
+          self.cond.wait()
+      if self.closed:
+        executor.dropped += 1
+        return False
+      queue.append(item)
+      self.cond.notify_all()
+    return True
+
+  def run(self):
+    cond = self.cond
+    queue = self.queue
+    while True:
+      with cond:
+        self.busy = False
+        if not queue:
+          cond.notify_all()
+        while not queue and not self.closed:
+          cond.wait()
+        if not queue:
+          return
+        func,args = queue.popleft()
+        self.busy = True
+        cond.notify_all()
+      try:
+        func(*args)
+      except Exception:
+        traceback.print_exc()
+      # don't keep the last notified object alive while idle.
+      func = args = None
+
+class ObserverExecutor(object):
+  '''Runs `use_thread` observer callbacks on a fixed pool of worker threads rather than
+  starting a thread for every notification.
+
+  Each observer is always handed to the same worker so that its notifications are delivered
+  in the order they happened. Every worker has a queue of at most `maxsize` pending
+  notifications, and `policy` decides what happens when a notification arrives for a full
+  queue:
+
+  * _block_: the notifying thread waits until there is room (the default).
+  * _drop-oldest_: the oldest pending notification is discarded.
+  * _drop-newest_: the new notification is discarded.
+
+  The number of discarded notifications is kept in the `dropped` attribute. Worker threads
+  are started on first use.
+  '''
+  policies = ('block','drop-oldest','drop-newest')
+
+  def __init__(self,workers=4,maxsize=1024,policy='block'):
+    if policy not in self.policies:
+      raise ValueError, "'policy' must be one of %s, not %r" % (','.join(map(repr,self.policies)),policy)
+    if workers < 1 or maxsize < 1:
+      raise ValueError, "'workers' and 'maxsize' must both be at least 1"
+    self.workers = workers
+    self.maxsize = maxsize
+    self.policy = policy
+    self.dropped = 0
+    self._workers = None
+    self._lock = Lock()
+    self._shutdown = False
+
+  def _start(self):
+    with self._lock:
+      if self._workers is None:
+        workers = [_Worker(self,i) for i in xrange(self.workers)]
+        for w in workers:
+          w.start()
+        self._workers = workers
+    return self._workers
+
+  def submit(self,key,func,*args):
+    '''Queues `func(*args)`. Calls submitted with equal `key` values are run in order.
+    Returns False if the call was dropped.
+    '''
+    if self._shutdown:
+      raise ObserverError, 'observer executor has been shut down'
+    workers = self._workers or self._start()
+    return workers[hash(key) % len(workers)].put((func,args))
+
+  def drain(self,timeout=None):
+    '''Waits until every queued call has run, returning False if `timeout` seconds pass first.'''
+    deadline = timeout is not None and _time() + timeout
+    me = current_thread()
+    for w in self._workers or ():
+      if w is me:
+        continue
+      with w.cond:
+        while w.queue or w.busy:
+          if deadline is False:
+            w.cond.wait()
+          else:
+            remaining = deadline - _time()
+            if remaining <= 0:
+              return False
+            w.cond.wait(remaining)
+    return True
+
+  def shutdown(self,wait=True,cancel=False):
+    '''Stops accepting new calls. Calls already queued are run unless `cancel` is true, in
+    which case they are discarded. If `wait` is true, blocks until the workers have exited.
+    '''
+    with self._lock:
+      self._shutdown = True
+      workers = self._workers or ()
+    for w in workers:
+      with w.cond:
+        w.closed = True
+        if cancel:
+          self.dropped += len(w.queue)
+          w.queue.clear()
+        w.cond.notify_all()
+    if wait:
+      me = current_thread()
+      for w in workers:
+        if w is not me:
+          w.join()
+
+_executor = None
+_executor_lock = Lock()
+
+def get_executor():
+  '''Returns the executor used for `use_thread` observers, creating a default one if needed.'''
+  global _executor
+  if _executor is None:
+    with _executor_lock:
+      if _executor is None:
+        _executor = ObserverExecutor()
+  return _executor
+
+def set_executor(executor=None,**kwargs):
+  '''Replaces the executor used for `use_thread` observers, either with `executor` or with a
+  new `ObserverExecutor` built from the keyword arguments. The previous executor is returned
+  and is not shut down.
+  '''
+  global _executor
+  if executor is None:
+    executor = ObserverExecutor(**kwargs)
+  elif kwargs:
+    raise TypeError, 'set_executor() takes either an executor or keyword arguments, not both'
+  with _executor_lock:
+    previous,_executor = _executor,executor
+  return previous
+
+def shutdown(wait=True,cancel=False):
+  '''Shuts down the executor used for `use_thread` observers (see `ObserverExecutor.shutdown`).
+  A new default executor will be created if any threaded observers are notified afterwards.
+  '''
+  global _executor
+  with _executor_lock:
+    executor,_executor = _executor,None
+  if executor is not None:
+    executor.shutdown(wait,cancel)
+
+class _LoopDispatcher(object):
+  '''Delivers notifications to observers on an event loop. Notifications queued up between
+  loop iterations are delivered in a single batch, so the loop is only woken once per batch.
+  '''
+  def __init__(self,loop):
+    # weak, so that the dispatcher doesn't keep its own key in _loop_dispatchers alive.
+    self.loop = weakref.ref(loop)
+    self._pending = deque()
+    self._scheduled = False
+    self._lock = Lock()
+
+  def put(self,o,args):
+    with self._lock:
+      self._pending.append((o,args))
+      if self._scheduled:
+        return
+      self._scheduled = True
+    loop = self.loop()
+    if loop is not None:
+      loop.call_soon_threadsafe(self._run)
+
+  def _run(self):
+    loop = self.loop()
+    pending = self._pending
+    with self._lock:
+      self._scheduled = False
+      batch = list(pending)
+      pending.clear()
+    for o,args in batch:
+      try:
+        result = o(*args)
+        if asyncio is not None and asyncio.iscoroutine(result):
+          asyncio.ensure_future(result,loop=loop)
+      except Exception, e:
+        loop.call_exception_handler({'message':'exception in observer %r' % o,'exception':e})
+
+_loop_dispatchers = weakref.WeakKeyDictionary()
+
+def _loop_dispatcher(loop):
+  with _executor_lock:
+    dispatcher = _loop_dispatchers.get(loop)
+    if dispatcher is None:
+      _loop_dispatchers[loop] = dispatcher = _LoopDispatcher(loop)
+  return dispatcher
+
+class _Filter(object):
+  '''The declarative filters of a single observer, checked before a notification is handed
+  over to anything. Previous values for `changed` are kept per (property,object) until the
+  object is destroyed.
+  '''
+  __slots__ = ('changed','where','sample','_previous','_counter')
+
+  def __init__(self,changed=False,where=None,sample=None):
+    self.changed = changed
+    self.where = where
+    self.sample = sample
+    self._previous = {}
+    self._counter = count()
+
+  def _forget(self,key):
+    return lambda ref: self._previous.pop(key,None)
+
+  def _changed(self,property,ob,args):
+    if not args:
+      return True
+    key = (property,id(ob))
+    previous = self._previous.get(key)
+    value = args[0]
+    if previous is None or previous[0]() is not ob:
+      try:
+        ref = weakref.ref(ob,self._forget(key))
+      except TypeError:
+        return True
+      self._previous[key] = [ref,value]
+      return True
+    old,previous[1] = previous[1],value
+    try:
+      return not (value is old or bool(value == old))
+    except Exception:
+      return True
+
+  def __call__(self,property,ob,args):
+    if self.changed and not self._changed(property,ob,args):
+      return False
+    if self.where is not None and args and not self.where(args[0]):
+      return False
+    if self.sample is not None and next(self._counter) % self.sample:
+      return False
+    return True
+
+class _Scheduler(Thread):
+  '''A single thread running the delayed calls of every rate limited observer, in deadline order.'''
+  def __init__(self):
+    Thread.__init__(self,name='observer_scheduler')
+    self.setDaemon(True)
+    self.heap = []
+    self.cond = Condition(Lock())
+    self.sequence = count()
+
+  def schedule(self,when,func,*args):
+    entry = (when,next(self.sequence),func,args)
+    with self.cond:
+      heappush(self.heap,entry)
+      if self.heap[0] is entry:
+        self.cond.notify()
+
+  def run(self):
+    heap = self.heap
+    cond = self.cond
+    while True:
+      with cond:
+        while True:
+          if not heap:
+            cond.wait()
+            continue
+          delay = heap[0][0] - _timer()
+          if delay <= 0:
+            break
+          cond.wait(delay)
+        when,_,func,args = heappop(heap)
+      try:
+        func(*args)
+      except Exception:
+        traceback.print_exc()
+
+_scheduler = None
+
+def _get_scheduler():
+  global _scheduler
+  if _scheduler is None:
+    with _executor_lock:
+      if _scheduler is None:
+        scheduler = _Scheduler()
+        scheduler.start()
+        _scheduler = scheduler
+  return _scheduler
+
+class _RateLimit(object):
+  '''Debounce, throttle and latest-value-only state for a single observer.
+
+  Notifications are coalesced per (property,object), keeping only the latest, and handed over
+  from the scheduler thread once the policy allows it. Pending notifications are never
+  discarded, so the final value of a burst is always delivered.
+  '''
+  __slots__ = ('debounce','interval','pending','sequence','deadline','last','scheduled','lock')
+
+  def __init__(self,debounce=None,max_rate=None):
+    self.debounce = debounce
+    self.interval = max_rate and 1.0 / max_rate or None
+    self.pending = {}
+    self.sequence = count()
+    self.deadline = 0
+    self.last = None
+    self.scheduled = False
+    self.lock = Lock()
+
+  def _due(self,now):
+    when = now
+    if self.debounce is not None:
+      when = self.deadline
+    if self.interval is not None and self.last is not None:
+      # a continuous burst is still delivered max_rate times a second.
+      due = max(now,self.last + self.interval)
+      when = self.debounce is not None and min(when,due) or due
+    return when
+
+  def put(self,o,args):
+    events = o.batch and args[0] or (args,)
+    now = _timer()
+    with self.lock:
+      pending = self.pending
+      for event in events:
+        pending[(event[0],id(event[1]))] = (next(self.sequence),event)
+      if self.debounce is not None:
+        self.deadline = now + self.debounce
+      if self.scheduled:
+        return
+      self.scheduled = True
+      if self.debounce is not None and self.interval is not None:
+        if self.last is None or now - self.last > self.interval:
+          # the burst starts now, as far as max_rate is concerned.
+          self.last = now
+      when = self._due(now)
+    _get_scheduler().schedule(when,self._fire,o)
+
+  def _fire(self,o):
+    now = _timer()
+    with self.lock:
+      when = self._due(now)
+      if when > now:
+        _get_scheduler().schedule(when,self._fire,o)
+        return
+      events = [event for _,event in sorted(self.pending.itervalues())]
+      self.pending.clear()
+      self.scheduled = False
+      self.last = now
+    if o.batch:
+      _dispatch(o,(events,))
+    else:
+      for event in events:
+        _dispatch(o,event)
+
+def _deliver(o,args):
+  if o.policy is not None:
+    o.policy.put(o,args)
+  else:
+    _dispatch(o,args)
+
+def _dispatch(o,args):
+  if o.loop is not None:
+    o.loop.put(o,args)
+  elif o.use_thread:
+    (_executor or get_executor()).submit(o,o,*args)
+  else:
+    #print 'CALLING:',repr(o),'\n  WITH:',repr(args)
+    o(*args)
+
+# id -> (weak reference,name) for objects which aren't registered, their names are resolved
+# once, the first time they fire an event while named observer sets exist.
+_object_names = {}
+_resolving = local()
+
+def _forget_name(ref):
+  # a new object may already be reusing the id.
+  entry = _object_names.get(ref.key)
+  if entry is not None and entry[0] is ref:
+    _object_names.pop(ref.key,None)
+
+def _object_name(ob):
+  key = id(ob)
+  entry = _object_names.get(key)
+  if entry is not None and entry[0]() is ob:
+    return entry[1]
+  resolving = getattr(_resolving,'ids',None)
+  if resolving is None:
+    _resolving.ids = resolving = set()
+  elif key in resolving:
+    # the object's repr() or name reads its own observed properties.
+    return None
+  resolving.add(key)
+  try:
+    name = _observed_name(ob)
+  finally:
+    resolving.discard(key)
+  try:
+    _object_names[key] = (weakref.KeyedRef(ob,_forget_name,key),name)
+  except TypeError:
+    pass
+  return name
+
+def _object_observersets(ob):
+  observed = _observed_objects.get(ob)
+  if observed is None:
+    # nothing observes this object directly, only named observer sets could still match it.
+    # Those are looked up without registering the object.
+    if not _observed_names:
+      return ()
+    observers = _observed_names.get(_object_name(ob))
+    if observers is None:
+      return ()
+    return (observers,)
+  return observed
+
+def _observers(observed,type,name):
+  for observersets in observed:
+    properties = observersets[type]
+    if not properties:
+      continue
+    if name is None:
+      # the observed property doesn't know its own name, so every observer of this access type
+      # is a potential match.
+      for observers in properties.values():
+        for o in observers:
+          yield o,o.property
+    else:
+      observers = properties.get(name)
+      if observers:
+        for o in observers:
+          yield o,name
+
+def _observe_callback(observed,type,name,ob,*args):
   #print type,repr(observed)
-  for observer in observed[key][type].itervalues():
-      for o in observer:
-        property = name or o.property
-        if o.use_thread:
-          t = Thread(target=o,name='%s_%s_observer' % (property,type),args=(property,ob)+args)
-          t.setDaemon(True)
-          t.start()
+  for o,property in _observers(observed,type,name):
+    if o.filter is not None and not o.filter(property,ob,args):
+      continue
+    if o.batch:
+      _deliver(o,([(property,ob)+args],))
+    else:
+      _deliver(o,(property,ob)+args)
+
+_batches = local()
+
+class _Batch(object):
+  '''Defers set and delete notifications made by the current thread until the outermost
+  batch exits, see `batch()`.
+  '''
+  def __enter__(self):
+    depth = getattr(_batches,'depth',0)
+    if not depth:
+      _batches.pending = {}
+      _batches.sequence = count()
+    _batches.depth = depth + 1
+    return self
+
+  def __exit__(self,exc_type,exc_value,tb):
+    _batches.depth -= 1
+    if not _batches.depth:
+      pending,_batches.pending = _batches.pending,None
+      _flush(sorted(pending.itervalues()))
+
+def batch():
+  '''Returns a context manager which defers all _set_ and _del_ notifications made by the
+  current thread until it exits. Repeated changes to the same property of the same object
+  are coalesced so that only the final value (or deletion) is notified. Observers registered
+  with `batch=True` receive all of their notifications in a single call. Notifications are
+  delivered even if the block raises an exception.
+
+  _get_ notifications are never deferred. Batches can be nested, only the outermost one
+  delivers notifications.
+
+  Usage:
+
+      with observer.batch():
+        model.x = 1
+        model.y = 2
+        model.x = 3   # observers of x are only told about 3
+  '''
+  return _Batch()
+
+def _defer(pending,ob,type,name,args):
+  # the sequence number orders coalesced events by their final change.
+  pending[(id(ob),name)] = (next(_batches.sequence),ob,type,name,args)
+
+def _flush(events):
+  batches = {}
+  order = []
+  for _,ob,type,name,args in events:
+    for observed in (_object_observersets(ob),_class_observersets(ob.__class__)):
+      for o,property in _observers(observed,type,name):
+        if o.filter is not None and not o.filter(property,ob,args):
+          continue
+        if o.batch:
+          # grouped by callback rather than by observer, so a callback registered for several
+          # properties or access types still gets one call with the events in order.
+          key = (o._func,o.loop,o.use_thread,o.policy)
+          group = batches.get(key)
+          if group is None:
+            batches[key] = group = []
+            order.append((key,o))
+          # the same observer can be reached through both the object and its class
+          if not group or group[-1][0] != property or group[-1][1] is not ob:
+            group.append((property,ob)+args)
         else:
-          #print 'CALLING:',repr(o),'\n  WITH:',repr(property)
-          o(property,ob,*args)
+          _deliver(o,(property,ob)+args)
+  for key,o in order:
+    _deliver(o,(batches[key],))
 
 def _observe_get(ob,value,name=None):
-  _observe_callback(_observed_objects,ob,'get',name,ob,value)
-  _observe_callback(_observed_classes,type(ob),'get',name,ob,value)
+  _observe_callback(_object_observersets(ob),'get',name,ob,value)
+  _observe_callback(_class_observersets(type(ob)),'get',name,ob,value)
 
 def _observe_set(ob,new_value,name=None):
-  _observe_callback(_observed_objects,ob,'set',name,ob,new_value)
-  _observe_callback(_observed_classes,type(ob),'set',name,ob,new_value)
+  pending = getattr(_batches,'pending',None)
+  if pending is not None:
+    _defer(pending,ob,'set',name,(new_value,))
+    return
+  _observe_callback(_object_observersets(ob),'set',name,ob,new_value)
+  _observe_callback(_class_observersets(type(ob)),'set',name,ob,new_value)
 
 def _observe_delete(ob,name=None):
-  _observe_callback(_observed_objects,ob,'del',name,ob)
-  _observe_callback(_observed_classes,type(ob),'del',name,ob)
+  pending = getattr(_batches,'pending',None)
+  if pending is not None:
+    _defer(pending,ob,'del',name,())
+    return
+  _observe_callback(_object_observersets(ob),'del',name,ob)
+  _observe_callback(_class_observersets(type(ob)),'del',name,ob)
 
 class observed(object):
   '''Creates an observable property. These act just like normal properties, including
@@ -309,19 +1222,28 @@ class observed(object):
     if self.fget is None:
       raise AttributeError, 'unreadable attribute'
     val = self.fget(obj)
-    _observe_get(obj,val,self.name)
+    name = self.name
+    if _computing:
+      _track(obj,name)
+    if name in _watched_properties or name is None:
+      _observe_get(obj,val,name)
     return val
 
   def __set__(self,obj,val):
     if self.fset is None:
       raise AttributeError,"can't set attribute"
-    _observe_set(obj,val,self.name)
+    name = self.name
+    if name in _watched_properties or name is None:
+      _observe_set(obj,val,name)
     self.fset(obj,val)
 
   def __delete__(self,obj):
     if self.fdel is None:
       raise AttributeError,"can't delete attribute"
-    _observe_delete(obj,self.name)
+    name = self.name
+    if name in _watched_properties or name is None:
+      _observe_delete(obj,name)
+    self.fdel(obj)
 
   def setter(self, func):
     self.fset = func
@@ -335,7 +1257,439 @@ class observed(object):
       self.name = func.func_name
     return self
 
-def add_observer(ob,property,callback,type='get',name=None,use_thread=False):
+# one item for every computed property evaluation in progress in any thread, each thread's own
+# evaluations keep the properties they read in a stack of dependency frames.
+_computing = []
+_tracking = local()
+
+def _track(ob,name):
+  frames = getattr(_tracking,'frames',None)
+  if frames:
+    frames[-1][(id(ob),name)] = ob
+
+class _ComputedEntry(object):
+  # deps maps each dependency to a weak reference to its object, usually the very object the
+  # entry is cached for.
+  __slots__ = ('value','valid','deps','invalidators','__weakref__')
+
+  def __init__(self):
+    self.valid = False
+    self.deps = ()
+    self.invalidators = {}
+
+class _Invalidator(object):
+  # observes a dependency of a computed property, only weakly referencing the object whose
+  # cached value it invalidates. It is kept alive by that object's cache entry.
+  __slots__ = ('entry','__weakref__')
+
+  def __init__(self,entry):
+    self.entry = weakref.ref(entry)
+
+  def __call__(self,*args):
+    entry = self.entry()
+    if entry is not None:
+      entry.valid = False
+
+class computed(observed):
+  '''Creates a read-only, cached property computed from other observed properties. While
+  the getter runs, every `@observed` (or `@computed`) property it reads is recorded as a
+  dependency; the result is cached per object until one of those dependencies is set or
+  deleted.
+
+  Observers of a computed property are notified of _get_ as usual, and of _set_ (with the new
+  value) whenever the value is recomputed after being invalidated, not when the dependencies
+  change.
+
+  Usage:
+
+      class Rect(object):
+        __metaclass__ = Observable
+
+        @observed
+        def width(self): return self._width
+        ...
+
+        @computed
+        def area(self): return self.width * self.height
+  '''
+  def __init__(self,fget=None,doc=None):
+    super(computed,self).__init__(fget,None,None,doc)
+    self._entries = None
+
+  def __repr__(self):
+    return '<computed property %r>' % self.name
+
+  def _entry(self,obj,create=False):
+    d = getattr(obj,'__dict__',None)
+    if d is not None:
+      key = 'computed:%s' % self.name
+      entry = d.get(key)
+      if entry is None and create:
+        d[key] = entry = _ComputedEntry()
+    else:
+      # objects without a __dict__ (i.e. using __slots__)
+      if self._entries is None:
+        self._entries = weakref.WeakKeyDictionary()
+      entry = self._entries.get(obj)
+      if entry is None and create:
+        self._entries[obj] = entry = _ComputedEntry()
+    return entry
+
+  def __get__(self,obj,objtype=None):
+    if obj is None:
+      return self
+    if self.fget is None:
+      raise AttributeError, 'unreadable attribute'
+    entry = self._entry(obj)
+    name = self.name
+    if entry is None or not entry.valid or _batched_change(entry.deps):
+      val = self._compute(obj,entry)
+    else:
+      val = entry.value
+      frames = _computing and getattr(_tracking,'frames',None)
+      if frames:
+        deps = frames[-1]
+        for key,ref in entry.deps.iteritems():
+          ob = ref and ref()
+          if ob is not None:
+            deps[key] = ob
+    if name in _watched_properties or name is None:
+      _observe_get(obj,val,name)
+    return val
+
+  def _compute(self,obj,entry):
+    frames = getattr(_tracking,'frames',None)
+    if frames is None:
+      _tracking.frames = frames = []
+    deps = {}
+    frames.append(deps)
+    _computing.append(None)
+    try:
+      val = self.fget(obj)
+    finally:
+      _computing.pop()
+      frames.pop()
+    if frames:
+      # computed properties read by other computed properties pass on their dependencies.
+      frames[-1].update(deps)
+
+    recomputed = entry is not None
+    if entry is None:
+      entry = self._entry(obj,True)
+    entry.value = val
+    entry.deps = refs = {}
+    invalidators = entry.invalidators
+    cacheable = True
+    for key,ob in deps.iteritems():
+      try:
+        refs[key] = weakref.ref(ob)
+      except TypeError:
+        refs[key] = None
+      if key in invalidators:
+        continue
+      invalidator = _Invalidator(entry)
+      try:
+        add_observer(ob,key[1],invalidator,'set',weak=True)
+        add_observer(ob,key[1],invalidator,'del',weak=True)
+      except (ObserverError,TypeError):
+        # a dependency that can't be observed means the value can never be cached.
+        cacheable = False
+        continue
+      invalidators[key] = invalidator
+    entry.valid = cacheable
+    name = self.name
+    if recomputed and (name in _watched_properties or name is None):
+      _observe_set(obj,val,name)
+    return val
+
+  def invalidate(self,obj):
+    '''Discards the cached value for `obj`, it will be recomputed the next time it is read.'''
+    entry = self._entry(obj)
+    if entry is not None:
+      entry.valid = False
+
+def _batched_change(deps):
+  # changes inside a batch() are only notified, and so only invalidate, when the batch exits.
+  pending = getattr(_batches,'pending',None)
+  if pending:
+    for key in deps:
+      if key in pending:
+        return True
+  return False
+
+def _merge_ranges(ranges):
+  merged = []
+  for start,stop in sorted(ranges):
+    if merged and start <= merged[-1][1]:
+      if stop > merged[-1][1]:
+        merged[-1] = (merged[-1][0],stop)
+    elif start < stop:
+      merged.append((start,stop))
+  return merged
+
+def _index_ranges(indices):
+  ranges = []
+  for i in sorted(set(indices)):
+    if ranges and ranges[-1][1] == i:
+      ranges[-1] = (ranges[-1][0],i + 1)
+    else:
+      ranges.append((i,i + 1))
+  return ranges
+
+class ArrayChange(object):
+  '''Describes a change to an `ObservableArray`, it is passed as the value of the array's
+  _set_ notifications.
+
+  * _ranges_: a sorted list of non-overlapping `(start,stop)` ranges of the indices which
+    changed, or None if the change is described by `mask`.
+  * _mask_: a numpy boolean array with an entry for each element, true where it changed
+    (numpy backed arrays only), or None.
+  * _resized_: true if the array changed length; indices after the first range then refer
+    to the array as it is now.
+  '''
+  __slots__ = ('ranges','mask','resized')
+
+  def __init__(self,ranges=None,mask=None,resized=False):
+    self.ranges = ranges
+    self.mask = mask
+    self.resized = resized
+
+  def __repr__(self):
+    if self.mask is not None:
+      return '<ArrayChange mask of %d%s>' % (int(self.mask.sum()),self.resized and ', resized' or '')
+    return '<ArrayChange %r%s>' % (self.ranges,self.resized and ', resized' or '')
+
+  def indices(self):
+    '''Iterates over the indices which changed.'''
+    if self.mask is not None:
+      return iter(numpy.flatnonzero(self.mask))
+    return (i for start,stop in self.ranges for i in xrange(start,stop))
+
+  def merge(self,other,length):
+    '''Returns a change describing both this change and `other`, for an array `length`
+    elements long.
+    '''
+    resized = self.resized or other.resized
+    if self.mask is None and other.mask is None:
+      return ArrayChange(_merge_ranges(self.ranges + other.ranges),None,resized)
+    mask = numpy.zeros(length,dtype=bool)
+    for change in (self,other):
+      if change.mask is not None:
+        n = min(length,len(change.mask))
+        mask[:n] |= change.mask[:n]
+      else:
+        for start,stop in change.ranges:
+          mask[start:stop] = True
+    return ArrayChange(None,mask,resized)
+
+class ObservableArray(object):
+  '''A typed array which notifies observers of its `items` property once per operation,
+  rather than once per element. Every mutating operation (item or slice assignment,
+  `update()`, `fill()`, in-place arithmetic, deletion and growth) results in a single _set_
+  notification whose value is an `ArrayChange` describing the indices that changed. Changes
+  made within a `batch()` are merged into one notification.
+
+  The array is backed by the standard `array` module, using `typecode`, or by a numpy array
+  (if numpy is available) when `use_numpy` is true or `initializer` is a numpy array, in which
+  case `typecode` can be any numpy dtype. numpy backed arrays also accept boolean mask and
+  integer array indices and use vectorized in-place arithmetic.
+
+  Usage:
+
+      values = ObservableArray('d',[0.0] * 1000000)
+      add_observer(values,'items',on_change,'set')
+      values[10:20] = [1.0] * 10      # on_change called once, ranges [(10,20)]
+      values *= 2                     # on_change called once, ranges [(0,1000000)]
+
+  The backing store is available as `items`; changes made to it directly are not observed.
+  _get_ notifications are never sent.
+  '''
+  __metaclass__ = Observable
+  observed_property = 'items'
+
+  def __init__(self,typecode='d',initializer=(),use_numpy=False):
+    if numpy is not None and (use_numpy or isinstance(initializer,numpy.ndarray)):
+      self._data = numpy.array(initializer,dtype=typecode)
+    elif use_numpy:
+      raise ObserverError, 'numpy is not available'
+    else:
+      self._data = array(typecode,initializer)
+
+  @property
+  def items(self):
+    return self._data
+
+  @property
+  def is_numpy(self):
+    return numpy is not None and isinstance(self._data,numpy.ndarray)
+
+  def __repr__(self):
+    return '<ObservableArray %r>' % (self._data,)
+
+  def __len__(self):
+    return len(self._data)
+
+  def __iter__(self):
+    return iter(self._data)
+
+  def __getitem__(self,index):
+    return self._data[index]
+
+  def tolist(self):
+    return self._data.tolist()
+
+  def _changed(self,ranges=None,mask=None,resized=False):
+    name = self.observed_property
+    if name not in _watched_properties:
+      return
+    if not resized:
+      if mask is not None:
+        if not mask.any():
+          return
+      elif not any(start < stop for start,stop in ranges):
+        return
+    change = ArrayChange(ranges,mask,resized)
+    pending = getattr(_batches,'pending',None)
+    if pending is not None:
+      previous = pending.get((id(self),name))
+      if previous is not None and previous[2] == 'set':
+        change = previous[4][0].merge(change,len(self._data))
+    _observe_set(self,change,name)
+
+  def _ranges(self,index,length):
+    # the changed ranges for an index into an array `length` elements long.
+    if isinstance(index,slice):
+      start,stop,step = index.indices(length)
+      if step == 1:
+        return [(start,max(start,stop))]
+      return _index_ranges(xrange(start,stop,step))
+    if numpy is not None and isinstance(index,(numpy.ndarray,list)):
+      index = numpy.asarray(index)
+      if index.dtype == bool:
+        return None
+      return _index_ranges(int(i) % length for i in index.ravel())
+    index = operator.index(index)
+    if index < 0:
+      index += length
+    return [(index,index + 1)]
+
+  def __setitem__(self,index,value):
+    data = self._data
+    length = len(data)
+    if self.is_numpy:
+      data[index] = value
+      ranges = self._ranges(index,length)
+      if ranges is None:
+        self._changed(mask=numpy.asarray(index,dtype=bool).copy())
+      else:
+        self._changed(ranges)
+      return
+    if isinstance(index,slice):
+      if not isinstance(value,array):
+        value = array(data.typecode,value)
+      data[index] = value
+      if len(data) != length:
+        start = index.indices(length)[0]
+        self._changed([(start,len(data))],resized=True)
+        return
+    else:
+      data[index] = value
+    self._changed(self._ranges(index,length))
+
+  def __delitem__(self,index):
+    data = self._data
+    length = len(data)
+    if self.is_numpy:
+      deleted = numpy.arange(length)[index]
+      self._data = numpy.delete(data,deleted)
+      start = deleted.size and int(deleted.min())
+    else:
+      ranges = self._ranges(index,length)
+      del data[index]
+      start = ranges and ranges[0][0]
+    if len(self._data) != length:
+      # every element from the first one deleted on has moved.
+      self._changed([(start,len(self._data))],resized=True)
+
+  def append(self,value):
+    self.extend((value,))
+
+  def extend(self,values):
+    length = len(self._data)
+    if self.is_numpy:
+      self._data = numpy.append(self._data,numpy.asarray(values,dtype=self._data.dtype))
+    else:
+      self._data.extend(array(self._data.typecode,values))
+    if len(self._data) != length:
+      self._changed([(length,len(self._data))],resized=True)
+
+  def update(self,indices,values):
+    '''Sets the element at each index in `indices` to the corresponding value in `values`.'''
+    data = self._data
+    if self.is_numpy:
+      indices = numpy.asarray(indices)
+      if not indices.size:
+        return
+      data[indices] = values
+      ranges = self._ranges(indices,len(data))
+      if ranges is None:
+        self._changed(mask=indices.copy())
+      else:
+        self._changed(ranges)
+      return
+    indices = list(indices)
+    for i,value in izip(indices,values):
+      data[i] = value
+    self._changed(_index_ranges(i % len(data) for i in indices))
+
+  def fill(self,value,start=0,stop=None):
+    '''Sets every element from `start` up to `stop` to `value`.'''
+    start,stop,_ = slice(start,stop).indices(len(self._data))
+    if stop <= start:
+      return
+    if self.is_numpy:
+      self._data[start:stop] = value
+    else:
+      self._data[start:stop] = array(self._data.typecode,[value]) * (stop - start)
+    self._changed([(start,stop)])
+
+  def _inplace(self,op,other):
+    data = self._data
+    if self.is_numpy:
+      op(data,other)
+    elif isinstance(other,(int,long,float,complex)):
+      for i in xrange(len(data)):
+        data[i] = op(data[i],other)
+    else:
+      if len(other) != len(data):
+        raise ValueError, 'operands could not be broadcast together (%d and %d elements)' % (len(data),len(other))
+      for i,value in enumerate(other):
+        data[i] = op(data[i],value)
+    if len(data):
+      self._changed([(0,len(data))])
+    return self
+
+  def __iadd__(self,other):
+    return self._inplace(operator.iadd,other)
+
+  def __isub__(self,other):
+    return self._inplace(operator.isub,other)
+
+  def __imul__(self,other):
+    return self._inplace(operator.imul,other)
+
+  def __idiv__(self,other):
+    return self._inplace(operator.idiv,other)
+
+  def __itruediv__(self,other):
+    return self._inplace(operator.itruediv,other)
+
+  def __ifloordiv__(self,other):
+    return self._inplace(operator.ifloordiv,other)
+
+def add_observer(ob,property,callback,type='get',name=None,use_thread=False,loop=None,
+                 batch=False,weak=False,debounce=None,max_rate=None,latest_only=False,
+                 changed=False,where=None,sample=None):
   '''Register a function, method or any python callable to be called when a specific
   property in an object is accessed, either via a get, a set or a delete.
 
@@ -345,9 +1699,9 @@ def add_observer(ob,property,callback,type='get',name=None,use_thread=False):
   is created which uses the Observable metaclass, the observer callback will automatically
   be registered for any future instances.
 
-  2. A class: In this case, any future instances of the class (which *must* use the
-  Observable metaclass) will generate callbacks for the indicated property and access
-  type.
+  2. A class: In this case, any instances of the class (which *must* use the
+  Observable metaclass) or of its subclasses will generate callbacks for the indicated
+  property and access type.
 
   3. An object: Finally, the callback will be called for indicated property access
   of the given type.
@@ -376,7 +1730,48 @@ def add_observer(ob,property,callback,type='get',name=None,use_thread=False):
   will remove all registered observers (optionally filtered by type) in this set.
 
   If the keyword argument `use_thread` evaluates to True, callbacks will always be called
-  in a separate thread.
+  in a separate thread, one of the worker threads of the shared `ObserverExecutor` (see
+  `set_executor()`).
+
+  If the keyword argument `loop` is an asyncio (or trollius) event loop, callbacks are
+  scheduled onto that loop with `call_soon_threadsafe` instead of being called directly;
+  notifications arriving together are delivered in one batch. The callback may be a coroutine
+  function, in which case the coroutine is run as a task on the loop. Coroutine functions
+  registered without a `loop` use the current event loop.
+
+  If the keyword argument `batch` evaluates to True, the callback is instead passed a single
+  argument, a list of `(property,object,...)` tuples with the same contents as the arguments
+  listed above. Inside a `batch()` block it is called once for all deferred notifications,
+  in the order they were made, even if it was registered for several properties or access
+  types. Otherwise it is called with a one element list for each notification.
+
+  If the keyword argument `weak` evaluates to True, the callback is only weakly referenced
+  (for bound methods, the method's object is weakly referenced) and the observer is removed
+  automatically once the callback, or its object, is destroyed.
+
+  The keyword arguments `debounce`, `max_rate` and `latest_only` rate limit the callback.
+  Notifications are coalesced per property and object so that only the latest value is
+  delivered, and are handed over (called directly, queued for a worker thread or scheduled on
+  the loop as usual) by a single scheduler thread shared by all rate limited observers:
+
+  * `debounce`: wait until no notification has arrived for this many seconds.
+  * `max_rate`: deliver at most this many times per second. Combined with `debounce`, a
+    continuous burst is still delivered at this rate.
+  * `latest_only`: with neither of the above, deliver as soon as possible but skip any values
+    superseded in the meantime.
+
+  The final value of a burst is always delivered.
+
+  The keyword arguments `changed`, `where` and `sample` filter notifications before they are
+  handed to a thread, the loop or a rate limit, so a filtered out notification costs little
+  more than the check itself:
+
+  * `changed`: if True, only notify when the value differs (`!=`) from the previous value seen
+    by this observer for the same property and object. The first notification always passes,
+    as do _del_ notifications.
+  * `where`: a callable passed the value, the notification is skipped unless it returns True.
+    _del_ notifications, which have no value, are not filtered.
+  * `sample`: only every Nth notification is delivered (_get_ observers only).
 
   **Callback Order**
   ==================
@@ -391,6 +1786,39 @@ def add_observer(ob,property,callback,type='get',name=None,use_thread=False):
   Observer callbacks must not alter the value in any fashion. Their return values are silently
   discarded.
   '''
+  _register_observers([_observer_spec(ob,property,callback,type,name,use_thread,loop,batch,weak,
+                                      debounce,max_rate,latest_only,changed,where,sample)])
+
+def add_observers(specs):
+  '''Registers many observers at once. Each spec is either a tuple of `add_observer()`
+  positional arguments, `(ob,property,callback[,type[,name]])`, or a dict of its keyword
+  arguments. Targets and observers behave exactly as if registered one at a time.
+
+  Every spec is checked before any observer is added, so either all of them are registered
+  or, if one is invalid, none are. Each observed property gets all of its new observers at
+  once and the registry lock is only taken once, which makes wiring up hundreds of observers
+  much cheaper than calling `add_observer()` for each.
+
+  Usage:
+
+      observer.add_observers([
+        (model,'x',on_x,'set','view'),
+        ('app.Model','y',on_y,'set','view'),
+        dict(ob=Model,property='z',callback=on_z,type='set',use_thread=True),
+      ])
+  '''
+  observers = []
+  for spec in specs:
+    if isinstance(spec,dict):
+      observers.append(_observer_spec(**spec))
+    else:
+      observers.append(_observer_spec(*spec))
+  _register_observers(observers)
+
+def _observer_spec(ob,property,callback,type='get',name=None,use_thread=False,loop=None,
+                   batch=False,weak=False,debounce=None,max_rate=None,latest_only=False,
+                   changed=False,where=None,sample=None):
+  # validates add_observer() arguments, returning the target and the wrapped callback.
   if name is None:
     name = _AnonymousKey
   if not callable(callback):
@@ -400,40 +1828,99 @@ def add_observer(ob,property,callback,type='get',name=None,use_thread=False):
     raise TypeError, 'observer callback must be either "get","set" or "del'
   if not isinstance(property,basestring):
     raise TypeError, 'property must be a string'
-
-  wrapper = _CallbackWrapper(property,type,use_thread and True or False,callback)
-  observers = None
+  if loop is None and asyncio is not None and asyncio.iscoroutinefunction(callback):
+    loop = asyncio.get_event_loop()
+  if loop is not None:
+    if use_thread:
+      raise TypeError, "observers cannot use both 'use_thread' and 'loop'"
+    loop = _loop_dispatcher(loop)
+  if debounce is not None and debounce < 0:
+    raise ValueError, "'debounce' cannot be negative"
+  if max_rate is not None and max_rate <= 0:
+    raise ValueError, "'max_rate' must be positive"
+  if sample is not None:
+    if type != 'get':
+      raise TypeError, "'sample' is only supported for get observers"
+    if sample < 1:
+      raise ValueError, "'sample' must be at least 1"
+  if where is not None and not callable(where):
+    raise TypeError, "'where' must be callable"
+  if changed or where is not None or sample is not None:
+    filter = _Filter(changed and True or False,where,sample)
+  else:
+    filter = None
+  if debounce is not None or max_rate is not None or latest_only:
+    policy = _RateLimit(debounce,max_rate)
+  else:
+    policy = None
+
+  if weak:
+    callback = _WeakCallback(callback)
+
+  return ob,_CallbackWrapper(property,type,use_thread and True or False,callback,loop,
+                             batch and True or False,policy,filter,name)
+
+def _register_observers(observers):
+  # adds a list of (target,wrapper), all or nothing.
+  with _registry_lock:
+    if _dead_refs:
+      _purge()
+    for ob,wrapper in observers:
+      _check_target(ob)
+    classes = False
+    entries = []
+    for ob,wrapper in observers:
+      observersets = _target_observersets(ob)
+      if isinstance(wrapper._func,_WeakCallback):
+        wrapper._func.on_death = partial(_prune,observersets,wrapper.type,wrapper.property)
+      entries.append((observersets,wrapper))
+      classes = classes or isinstance(ob,(basestring,TypeType))
+    _add_wrappers(entries)
+    if classes:
+      _invalidate_class_dispatch()
+
+def _check_target(ob):
+  # raises ObserverError if add_observer() can't register against `ob`.
   if isinstance(ob,basestring):
-    observersets = _observed_names.setdefault(ob,{'get':{},'set':{},'del':{}})[type]
-    observersets.setdefault(name,set()).add(wrapper)
-    # update any Observable classes and objects that match.
-    for cls,_observers in _observed_classes.iteritems():
-      if isinstance(cls,_Ref):
-        key = cls.key
-      else:
-        key = getattr(cls,'__observed_name__',None)
-        if key is None:
-          key = cls.__full_name__
-        elif callable(key):
-          key = key()
-      if key == ob:
-        _observers[type].setdefault(name,set()).add(wrapper.clone())
-    for inst,_observers in _observed_objects.iteritems():
-      if inst.key == ob or str(type(inst())) == ob:
-        _observers[type].setdefault(name,set()).add(wrapper.clone())
+    return
   elif isinstance(ob,TypeType):
-    observers = _observed_classes.get(ob)
-    if observers is None:
+    if _observed_classes.get(ob) is None:
       raise ObserverError,'class %r does not support observation' % ob
   elif isinstance(ob,(ClassType,InstanceType)):
     raise ObserverError,'old-style classes and instances do not support observation (%r)' % ob
-  else:
-    observers = _observed_objects.get(ob)
-    if observers is None:
+  elif _observed_objects.get(ob) is None:
+    if not isinstance(ob.__class__,Observable):
       raise ObserverError,'object %r does not support observation' % ob
+    Observable._register(ob)
 
-  if observers is not None:
-    observers[type].setdefault(name,set()).add(wrapper)
+def _target_observersets(ob):
+  # the observer sets add_observer() registers into for `ob`, created if needed. The caller
+  # must hold _registry_lock and have checked `ob` with _check_target().
+  if isinstance(ob,basestring):
+    observers = _observed_names.get(ob)
+    if observers is None:
+      _observed_names[ob] = observers = _new_observersets()
+      # share the new named set with any Observable classes and objects that match.
+      for ref in list(_refs_by_name.get(ob,())):
+        if isinstance(ref,_Ref) and ref() is None:
+          continue
+        if isinstance(ref,_Ref) and ref._type is not TypeType:
+          registry = _observed_objects
+        else:
+          registry = _observed_classes
+        observed = registry.get(ref)
+        if observed is not None:
+          registry[ref] = observed + (observers,)
+    return observers
+  elif isinstance(ob,TypeType):
+    return _observed_classes[ob][0]
+  observed = _observed_objects[ob]
+  observers = _own_observersets(observed)
+  if observers is None:
+    # copy on write, the object gets observer sets of its own in front of the shared ones.
+    observers = _OwnObservers()
+    _observed_objects[ob] = (observers,) + observed
+  return observers
 
 def remove_all_observers(name,type='ALL'):
   '''Removes all observers registered under `name` (the name keyword argument to
@@ -449,28 +1936,389 @@ def remove_all_observers(name,type='ALL'):
 
   if type in ('all','ALL'):
     type = None
-  for ob,observersets in _observed_names.iteritems():
-    for t,observers in observersets.iteritems():
-      if type and t != type:
-        continue
-      if name in observers:
-        del observers[name]
-  for ob,observersets in _observed_classes.iteritems():
-    for t,observers in observersets.iteritems():
-      if type and t != type:
-        continue
-      if name in observers:
-        del observers[name]
-  for ob,observersets in _observed_objects.iteritems():
-    for t,observers in observersets.iteritems():
-      if type and t != type:
+  with _registry_lock:
+    if _dead_refs:
+      _purge()
+    tables = _observersets_by_name.get(name)
+    if not tables:
+      return
+    for key,observersets in tables.items():
+      remaining = False
+      for t,properties in observersets.items():
+        for property,observers in properties.items():
+          if type and t != type:
+            remaining = remaining or any(o.name == name for o in observers)
+            continue
+          kept = tuple(o for o in observers if o.name != name)
+          if len(kept) != len(observers):
+            _replace(properties,property,observers,kept)
+      if not remaining:
+        del tables[key]
+    if not tables:
+      del _observersets_by_name[name]
+    _invalidate_class_dispatch()
+
+def compact():
+  '''Removes the registry entries of destroyed classes and objects, and weak observers whose
+  callback was destroyed, right away, returning how many were removed.
+
+  These are not removed from the registry while they are being garbage collected, which could
+  happen at any point in unrelated code, but queued and removed in batches the next time the
+  registry changes: when observers are added or removed, when an Observable class is created
+  or when an object is first observed. Queued entries can no longer be notified or observed,
+  they just take up memory until then.
+  '''
+  with _registry_lock:
+    count = len(_dead_refs)
+    _purge()
+  return count
+
+def registry_stats():
+  '''Returns a dict describing the registry: the number of registered `classes`, `objects`
+  (both including any pending purge) and observer `names`, the number of `observers` of each
+  property, `pending_purge`, the number of destroyed classes, objects and weak observers
+  waiting to be removed (see `compact()`), and `purged`, the number of classes and objects
+  removed so far.
+  '''
+  with _registry_lock:
+    return {'classes':len(_observed_classes),
+            'objects':len(_observed_objects),
+            'names':len(_observed_names),
+            'observers':dict(_watched_properties),
+            'pending_purge':len(_dead_refs),
+            'purged':_purged}
+
+class EventForwarder(object):
+  '''Forwards observer notifications to another process through a `multiprocessing` queue
+  (anything with a `put` method) or pipe connection (anything with a `send` method), where an
+  `EventReceiver` replays them.
+
+  Notifications are buffered and sent in frames of up to `batch_size` events; a frame is also
+  sent whenever `flush()` is called, so callers should flush once a burst of changes is done.
+  Frames, and the events within them, are sent in the order the notifications happened.
+  Values must be picklable.
+
+  Usage:
+
+      forwarder = EventForwarder(queue)
+      forwarder.forward(Model,'value')        # all set and del notifications
+      forwarder.forward('config','debug','get')
+      ...
+      forwarder.flush()
+  '''
+  def __init__(self,channel,batch_size=1024):
+    self.channel = channel
+    self.batch_size = batch_size
+    self.frames = 0
+    self._send = getattr(channel,'put',None) or channel.send
+    self._events = []
+    self._names = weakref.WeakKeyDictionary()
+    self._lock = Lock()
+
+  def forward(self,ob,property,types=('set','del')):
+    '''Forwards notifications for `property` of `ob` (see `add_observer()`), `types` is a
+    single access type or a sequence of them.
+    '''
+    if isinstance(types,basestring):
+      types = (types,)
+    for t in types:
+      t = t[:3]
+      # set and del share one callback, so batch() hands their events over together and in order.
+      callback = t == 'get' and self._observe_get or self._observe
+      add_observer(ob,property,callback,t,name=self,batch=True)
+
+  def _name(self,ob):
+    try:
+      return self._names[ob]
+    except (KeyError,TypeError):
+      pass
+    names = (_observed_name(ob),_observed_name(ob.__class__))
+    try:
+      self._names[ob] = names
+    except TypeError:
+      pass
+    return names
+
+  def _observe_get(self,events):
+    self._observe(events,'get')
+
+  def _observe(self,events,type=None):
+    with self._lock:
+      buffer = self._events
+      for event in events:
+        name,cls_name = self._name(event[1])
+        # only set notifications carry a value.
+        t = type or (len(event) > 2 and 'set' or 'del')
+        buffer.append((name,cls_name,event[0],t,event[2:]))
+      if len(buffer) >= self.batch_size:
+        self._flush()
+
+  def _flush(self):
+    if self._events:
+      events,self._events = self._events,[]
+      self.frames += 1
+      self._send(('observer-events',self.frames,events))
+
+  def flush(self):
+    '''Sends any buffered notifications.'''
+    with self._lock:
+      self._flush()
+
+  def close(self):
+    '''Stops forwarding, sends any buffered notifications and tells the receiver there will
+    be no more.
+    '''
+    remove_all_observers(self)
+    with self._lock:
+      self._flush()
+      self._send(None)
+
+class RemoteObject(object):
+  '''Stands in for an object in another process when an `EventReceiver` replays its
+  notifications. `name` is the object's observed name and `class_name` that of its class.
+  '''
+  __slots__ = ('name','class_name')
+
+  def __init__(self,name,class_name):
+    self.name = name
+    self.class_name = class_name
+
+  def __repr__(self):
+    return '<RemoteObject %s of %s>' % (self.name,self.class_name)
+
+class EventReceiver(object):
+  '''Receives notifications sent by an `EventForwarder` in another process and calls the
+  observers registered in this process under the object's name or its class's name (see
+  `add_observer()`), passing a `RemoteObject` in place of the object.
+
+  Note that _get_ notifications are replayed to _get_ observers with the value that was read.
+  '''
+  def __init__(self,channel):
+    self.channel = channel
+    self.closed = False
+    if hasattr(channel,'get'):
+      self._recv = channel.get
+    else:
+      def recv(block=True,timeout=None):
+        if not block or timeout is not None:
+          if not channel.poll(not block and 0 or timeout):
+            raise Empty
+        return channel.recv()
+      self._recv = recv
+
+  def receive(self,timeout=None):
+    '''Waits for and replays a single frame, returning the number of events replayed or None
+    once the forwarder has closed. Raises Queue.Empty if `timeout` seconds pass first.
+    '''
+    if self.closed:
+      return None
+    frame = self._recv(True,timeout)
+    if frame is None:
+      self.closed = True
+      return None
+    kind,seq,events = frame
+    if kind != 'observer-events':
+      raise ObserverError, 'unexpected frame %r' % kind
+    self.replay(events)
+    return len(events)
+
+  def run(self):
+    '''Replays frames until the forwarder closes.'''
+    while self.receive() is not None:
+      pass
+
+  def replay(self,events):
+    '''Replays a list of events as sent by an `EventForwarder`.'''
+    objects = {}
+    observed = {}
+    batches = OrderedDict()
+    for name,cls_name,property,type,args in events:
+      ob = objects.get(name)
+      if ob is None:
+        objects[name] = ob = RemoteObject(name,cls_name)
+        if name == cls_name:
+          observed[name] = _shared_observersets(name)
+        else:
+          observed[name] = _shared_observersets(name,cls_name)
+      for o,_ in _observers(observed[name],type,property):
+        if o.filter is not None and not o.filter(property,ob,args):
+          continue
+        if o.batch:
+          batches.setdefault(o,[]).append((property,ob)+args)
+        else:
+          _deliver(o,(property,ob)+args)
+    for o,group in batches.iteritems():
+      _deliver(o,(group,))
+
+_monotonic = getattr(time,'monotonic',_time)
+
+class Journal(object):
+  '''A bounded, in-memory record of set and delete notifications for the observed properties
+  it is told to `watch()`. At most `maxlen` entries are kept, older ones are discarded.
+
+  Each entry is a tuple `(sequence,ref,property,type,value,timestamp)`, where `sequence`
+  counts up from 1, `ref` is a weak reference to the object (None if it can't be weakly
+  referenced), `type` is _set_ or _del_, `value` is None for deletions and `timestamp` is
+  monotonic where the platform provides it.
+
+  A late observer can catch up by replaying the journal and then registering itself:
+
+      journal = Journal(10000)
+      journal.watch(Model,'value')
+      ...
+      last = journal.replay(callback)
+      add_observer(Model,'value',callback,'set')
+  '''
+  def __init__(self,maxlen=4096):
+    self.maxlen = maxlen
+    self.sequence = 0
+    self._entries = deque(maxlen=maxlen)
+    self._lock = Lock()
+
+  def watch(self,ob,property,types=('set','del')):
+    '''Records notifications for `property` of `ob` (see `add_observer()`), `types` is a
+    single access type or a sequence of them.
+    '''
+    if isinstance(types,basestring):
+      types = (types,)
+    for t in types:
+      t = t[:3]
+      if t not in ('set','del'):
+        raise TypeError, 'journals only record "set" and "del" notifications'
+      # one callback for both, so batch() hands their events over together and in order.
+      add_observer(ob,property,self._record,t,name=self,batch=True)
+
+  def close(self):
+    '''Stops recording, entries already recorded are kept.'''
+    remove_all_observers(self)
+
+  def _record(self,events):
+    now = _monotonic()
+    with self._lock:
+      sequence = self.sequence
+      append = self._entries.append
+      for event in events:
+        try:
+          ref = weakref.ref(event[1])
+        except TypeError:
+          ref = None
+        sequence += 1
+        # only set notifications carry a value.
+        if len(event) > 2:
+          append((sequence,ref,event[0],'set',event[2],now))
+        else:
+          append((sequence,ref,event[0],'del',None,now))
+      self.sequence = sequence
+
+  def __len__(self):
+    return len(self._entries)
+
+  def since(self,sequence=0):
+    '''Returns a list of the entries recorded after `sequence`. If older entries have been
+    discarded, the first entry returned will have a sequence greater than `sequence + 1`.
+    '''
+    with self._lock:
+      entries = self._entries
+      if not entries:
+        return []
+      skip = sequence - entries[0][0] + 1
+      if skip <= 0:
+        return list(entries)
+      return list(islice(entries,skip,None))
+
+  def replay(self,callback,since=0,types=('set','del')):
+    '''Calls `callback` for each entry recorded after `since` with the same arguments an
+    observer registered through `add_observer()` would have been passed. Entries of other
+    `types` or for objects which no longer exist are skipped. Returns the sequence of the
+    last entry replayed, or `since` if none were.
+    '''
+    if isinstance(types,basestring):
+      types = (types,)
+    types = tuple(t[:3] for t in types)
+    for sequence,ref,property,type,value,timestamp in self.since(since):
+      since = sequence
+      ob = ref() if ref is not None else None
+      if ob is None or type not in types:
         continue
-      if name in observers:
-        del observers[name]
+      if type == 'set':
+        callback(property,ob,value)
+      else:
+        callback(property,ob)
+    return since
+
+class ObserverStream(object):
+  '''An asynchronous stream of observer notifications, see `observe_stream()`.
+
+  Each event is the tuple of arguments an observer callback would have been passed. Events
+  are read with `get()`, which returns a future for the next event. Once the stream has been
+  closed and is empty, reading from it raises StopIteration, which ends a trollius coroutine.
+
+  Streams must only be read and closed from their event loop's thread.
+  '''
+  def __init__(self,loop,maxsize=0):
+    self.loop = loop
+    self._events = deque(maxlen=maxsize or None)
+    self._getters = deque()
+    self._closed = False
+
+  def _put(self,*event):
+    getters = self._getters
+    while getters:
+      getter = getters.popleft()
+      if not getter.done():
+        getter.set_result(event)
+        return
+    self._events.append(event)
+
+  def get(self):
+    '''Returns a future for the next event.'''
+    getter = asyncio.Future(loop=self.loop)
+    if self._events:
+      getter.set_result(self._events.popleft())
+    elif self._closed:
+      getter.set_exception(StopIteration())
+    else:
+      self._getters.append(getter)
+    return getter
+
+  def close(self):
+    '''Stops observing. Events already received can still be read.'''
+    if not self._closed:
+      self._closed = True
+      remove_all_observers(self)
+      while self._getters:
+        getter = self._getters.popleft()
+        if not getter.done():
+          getter.set_exception(StopIteration())
+
+def observe_stream(ob,property,type='set',loop=None,maxsize=0):
+  '''Observe a property, reading the notifications from an `ObserverStream` instead of having
+  a callback called. `ob`, `property` and `type` are the same as for `add_observer()`.
+
+  Notifications are delivered on `loop` (the current event loop by default). If `maxsize` is
+  given, at most that many unread events are kept and older ones are discarded.
+
+  Usage:
+
+      stream = observe_stream(model,'value')
+      while True:
+        property,ob,value = yield From(stream.get())
+        ...
+  '''
+  if asyncio is None:
+    raise ObserverError, 'observe_stream() requires asyncio or trollius'
+  if loop is None:
+    loop = asyncio.get_event_loop()
+  stream = ObserverStream(loop,maxsize)
+  add_observer(ob,property,stream._put,type,name=stream,loop=loop)
+  return stream
 
 if __name__ == '__main__':
   import gc
 
+  # Observable classes defined by this module itself
+  module_classes = len(_observed_classes)
+
   out = sys.stdout.write
   def get_observer(prop,ob,val):
     out('[%s OBSERVED: %s for %s] ' % (ob.name,repr(val),prop))
@@ -558,7 +2406,7 @@ if __name__ == '__main__':
 
   print '--- Cleanup Time'
   remove_all_observers('TEST')
-  print len(_observed_classes)
+  print len(_observed_classes) - module_classes
   dynamic = type('DynamicMonkey',(Monkey,),{})
   del cheese
   del Cheese
@@ -566,7 +2414,8 @@ if __name__ == '__main__':
   del Monkey
   del foobar
   gc.collect()
+  compact()
   assert len(_observed_objects) == 0, 'dangling object references exist'
-  assert len(_observed_classes) == 0, 'dangling class references exist'
+  assert len(_observed_classes) == module_classes, 'dangling class references exist'
 
 # vi: :set sts=2 sw=2 ai et tw=0:
@@ -1,10 +1,26 @@
-'''Context manager timer -- based on threading.Timer
+'''Context manager timer -- all active timers share a single scheduler thread
 '''
 from __future__ import with_statement
 
-__all__ = ('TimerExpired','timed')
-import thread,threading
+__all__ = ('TimerExpired','timed','timed_task','check','remaining')
+import thread,threading,weakref
 from time import time as _time
+from heapq import heappush,heappop,heapify
+from itertools import count
+
+try:
+  import ctypes
+  _set_async_exc = ctypes.pythonapi.PyThreadState_SetAsyncExc
+except (ImportError,AttributeError):
+  _set_async_exc = None
+
+try:
+  import asyncio
+except ImportError:
+  try:
+    import trollius as asyncio
+  except ImportError:
+    asyncio = None
 
 class TimerExpired(Exception):
   '''Raised when code running under timer() has expired, a single value, the number of elapsed
@@ -14,18 +30,139 @@ class TimerExpired(Exception):
     Exception.__init__(self,elapsed)
     self.elapsed = elapsed
 
+class _Interrupt(BaseException):
+  '''Raised asynchronously in a thread whose timer context has expired, the context turns it
+  into TimerExpired. Not an Exception so that `except Exception` blocks don't swallow it.
+  '''
+
+if _set_async_exc is not None:
+  _interrupt_exc = _Interrupt
+else:
+  _interrupt_exc = KeyboardInterrupt
+
+def _interrupt(ident):
+  if _set_async_exc is not None:
+    _set_async_exc(ctypes.c_long(ident),ctypes.py_object(_Interrupt))
+  elif ident == _main_ident:
+    thread.interrupt_main()
+
+def _clear_interrupt(ident):
+  # discards an interrupt that hasn't been raised yet.
+  if _set_async_exc is not None:
+    _set_async_exc(ctypes.c_long(ident),None)
+
+_main_ident = thread.get_ident()
+
+class _Scheduler(threading.Thread):
+  '''Expires the deadlines of every active timer context from one daemon thread. Deadlines are
+  kept in a heap, cancelled ones are left in place and skipped (the heap is rebuilt once they
+  make up half of it) so both adding and cancelling are O(log n) at worst.
+  '''
+  def __init__(self):
+    super(_Scheduler,self).__init__(name='timer_scheduler')
+    self.setDaemon(True)
+    self._heap = []
+    self._cancelled = 0
+    self._cond = threading.Condition(threading.Lock())
+    self._sequence = count()
+
+  def add(self,deadline,context):
+    entry = [deadline,next(self._sequence),context]
+    with self._cond:
+      heappush(self._heap,entry)
+      if self._heap[0] is entry:
+        self._cond.notify()
+    return entry
+
+  def cancel(self,entry):
+    '''Returns False if the entry has already expired.'''
+    with self._cond:
+      if entry[2] is None:
+        return False
+      entry[2] = None
+      self._cancelled += 1
+      heap = self._heap
+      if self._cancelled * 2 > len(heap):
+        heap[:] = [e for e in heap if e[2] is not None]
+        heapify(heap)
+        self._cancelled = 0
+    return True
+
+  def run(self):
+    heap = self._heap
+    cond = self._cond
+    with cond:
+      while True:
+        while heap and heap[0][2] is None:
+          heappop(heap)
+          self._cancelled -= 1
+        if not heap:
+          cond.wait()
+          continue
+        delay = heap[0][0] - _time()
+        if delay > 0:
+          cond.wait(delay)
+          continue
+        entry = heappop(heap)
+        context,entry[2] = entry[2],None
+        # expired while holding the lock, so a context that cancels successfully knows it
+        # hasn't been and won't be expired.
+        try:
+          context._expire()
+        except Exception:
+          pass
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def _get_scheduler():
+  global _scheduler
+  scheduler = _scheduler
+  if scheduler is None or not scheduler.is_alive():
+    with _scheduler_lock:
+      # the scheduler thread won't be running in a forked child.
+      if _scheduler is None or not _scheduler.is_alive():
+        _scheduler = _Scheduler()
+        _scheduler.start()
+      scheduler = _scheduler
+  return scheduler
+
+_local = threading.local()
+
+def _contexts():
+  try:
+    return _local.contexts
+  except AttributeError:
+    _local.contexts = contexts = []
+    return contexts
+
 class _TimerContext(object):
   '''Creates a time context, all code bound to the context run complete without the given
   interval (float seconds) otherwise TimerExpired is raised.
+
+  Contexts can be used in any thread. On expiry, an exception is raised asynchronously in the
+  thread running the block (through the C API where available, in the main thread otherwise),
+  which the context turns into TimerExpired as it exits. Blocking calls such as `time.sleep()`
+  are not interrupted, the exception is raised once they return. With `interrupt=False` the
+  block is never interrupted and must instead call `check()` (or the module level `check()`)
+  every so often, which raises TimerExpired once the context has expired; the same applies in
+  threads other than the main thread where the C API isn't available. Either way, TimerExpired
+  is raised on exit if the block overran.
+
+  Contexts can be nested, the tightest deadline of all enclosing contexts in the same thread
+  applies: a nested context never runs past the deadline of the context it is in. Each context
+  can only be entered once, RuntimeError is raised otherwise.
   '''
-  def __init__(self,interval):
+  def __init__(self,interval,interrupt=True):
     super(_TimerContext,self).__init__()
     self._interval = interval
-    self._main_thread = None
+    self._interrupt = interrupt
+    self._thread = None
     self._start = None
     self._stop = None
-    self.__abort = False
-    self.__timer = threading.Timer(interval,self._expire)
+    self._deadline = None
+    self._expired = False
+    self.__entry = None
 
   @property
   def elapsed(self):
@@ -35,46 +172,263 @@ class _TimerContext(object):
 
   @property
   def remaining(self):
-    '''Returns the number of seconds remaining untl the time context will expire and
-    TimerExpired will be raised.
+    '''Returns the number of seconds remaining untl the time context (or an enclosing one)
+    will expire and TimerExpired will be raised.
 
     Remaining may be 0 for a very short while before the interrupt exception is
-    delivered to the main thread and the stack unwinds.
+    delivered to the thread and the stack unwinds.
     '''
-    return max(0.0,self._interval - (_time() - self._start))
+    return max(0.0,self._deadline - _time())
 
-  def __enter__(self):
-    self._main_thread = tuple(threading.enumerate())[0]
+  def check(self):
+    '''Raises TimerExpired if the context (or an enclosing one) has expired.'''
+    if self._expired or _time() >= self._deadline:
+      raise TimerExpired(_time() - self._start)
 
-    if not isinstance(self._main_thread,threading._MainThread):
-      raise RuntimeError,"cannot use the 'timed' context except in the main thread (this appears not to be the main thread)"
+  def __enter__(self):
+    if self._start is not None:
+      raise RuntimeError,"cannot use the same 'timed' context more than once"
+    contexts = _contexts()
+    self._thread = thread.get_ident()
+    # without the C API only the main thread can be interrupted.
+    self._interrupt = self._interrupt and (_set_async_exc is not None or self._thread == _main_ident)
     self._start = _time()
-    self.__timer.setDaemon(True)
-    self.__timer.start()
+    deadline = self._start + self._interval
+    if contexts and contexts[-1]._deadline <= deadline:
+      # the enclosing context expires first, and its interrupt unwinds this one too.
+      self._deadline = contexts[-1]._deadline
+    else:
+      self._deadline = deadline
+      self.__entry = _get_scheduler().add(deadline,self)
+    contexts.append(self)
     return self
 
   def __exit__(self,exc_type,exc_value,tb):
-    abort = self.__abort
-    main = self._main_thread
-    if self.__timer.is_alive():
-      self.__timer.cancel()
-    self._main_thread = None
-    self.__timer = None
-    self._stop = _time()
-    if abort:
+    while True:
+      try:
+        expired = self._leave()
+        break
+      except _interrupt_exc:
+        # an interrupt arriving while leaving is handled below, just like one raised in the block.
+        pass
+    if self._expired:
       raise TimerExpired(self._stop - self._start)
+    if expired:
+      # an enclosing context expired, let its interrupt through (or raise it again if it was
+      # discarded above).
+      if exc_type is _interrupt_exc:
+        return False
+      raise _interrupt_exc
+
+  def _leave(self):
+    # safe to repeat if interrupted part way through. Returns True if an enclosing context has
+    # expired and interrupted this thread. Any interrupt not yet raised is discarded.
+    if self._stop is None:
+      self._stop = _time()
+    entry,self.__entry = self.__entry,None
+    if entry is not None:
+      _scheduler.cancel(entry)
+    contexts = _contexts()
+    if contexts and contexts[-1] is self:
+      contexts.pop()
+    interrupted = any(c._expired and c._interrupt for c in contexts)
+    if interrupted or (self._expired and self._interrupt):
+      _clear_interrupt(self._thread)
+    return interrupted
 
   def _expire(self):
-    if self._start and not self._stop:
-      # still running, abort the main thread with a KeyboardInterrupt that will get ignored by the
-      # context's __exit__ handler.
-      self.__abort = True
-      thread.interrupt_main()
+    if self._stop is None:
+      # still running, the interrupt is turned into TimerExpired by __exit__.
+      self._expired = True
+      if self._interrupt:
+        _interrupt(self._thread)
 
 def timed(interval,*args,**kwargs):
   return _TimerContext(interval,*args,**kwargs)
 timed.__doc__ = _TimerContext.__doc__
 
+# task -> its active _TaskTimerContexts, innermost last.
+_task_contexts = weakref.WeakKeyDictionary()
+
+def _current_task(loop=None):
+  try:
+    current_task = getattr(asyncio,'current_task',None) or asyncio.Task.current_task
+    return current_task(loop)
+  except Exception:
+    # no event loop in this thread.
+    return None
+
+class _InheritDeadlines(object):
+  '''An event loop task factory giving tasks created by a task inside a timer context that
+  context as their own enclosing one, much like a contextvar is copied into new tasks. With
+  trollius, where coroutines waited on with `yield From()` run as separate tasks, this is what
+  lets them see the caller's deadline.
+  '''
+  def __init__(self,factory):
+    self.factory = factory
+
+  def __call__(self,loop,coro):
+    if self.factory is None:
+      task = asyncio.Task(coro,loop=loop)
+    else:
+      task = self.factory(loop,coro)
+    parent = _current_task(loop)
+    contexts = parent is not None and _task_contexts.get(parent)
+    if contexts:
+      _task_contexts[task] = [contexts[-1]]
+    return task
+
+# loop -> number of task contexts active on it, the task factory is only installed meanwhile.
+_active_loops = weakref.WeakKeyDictionary()
+
+def _inherit_deadlines(loop):
+  active = _active_loops.get(loop,0)
+  set_task_factory = getattr(loop,'set_task_factory',None)
+  if not active and set_task_factory is not None:
+    factory = loop.get_task_factory()
+    if not isinstance(factory,_InheritDeadlines):
+      set_task_factory(_InheritDeadlines(factory))
+  _active_loops[loop] = active + 1
+
+def _restore_task_factory(loop):
+  active = _active_loops.pop(loop,1) - 1
+  if active > 0:
+    _active_loops[loop] = active
+  elif getattr(loop,'set_task_factory',None) is not None:
+    # unless something else has replaced it since.
+    factory = loop.get_task_factory()
+    if isinstance(factory,_InheritDeadlines):
+      loop.set_task_factory(factory.factory)
+
+class _TaskTimerContext(object):
+  '''Creates a time context for code running in an asyncio (or trollius) task, all code bound
+  to the context must complete within the given interval (float seconds) otherwise the task is
+  cancelled and TimerExpired is raised.
+
+  The deadline is scheduled with the event loop's own timer, no threads are involved. Cancelling
+  the task raises CancelledError wherever the task is waiting, which the context turns into
+  TimerExpired as it exits. Contexts can be nested within a task and the tightest deadline
+  applies, `remaining()` returns the budget left for code further down the call chain. Tasks
+  started from within a context inherit it (where the loop supports task factories, the loop's
+  factory is wrapped while any context is active on it), so their own contexts can't outlast
+  it either, even once they outlive the task that started them.
+
+  Usage (trollius):
+
+      @trollius.coroutine
+      def handler(request):
+        with timer.timed_task(5):
+          data = yield From(fetch(request,timeout=timer.remaining()))
+  '''
+  def __init__(self,interval,loop=None):
+    super(_TaskTimerContext,self).__init__()
+    self._interval = interval
+    self._loop = loop
+    self._task = None
+    self._start = None
+    self._stop = None
+    self._deadline = None
+    self._expired = False
+    self._handle = None
+
+  @property
+  def elapsed(self):
+    '''Returns the number of seconds elapsed since the time context was entered.
+    '''
+    return self._loop.time() - self._start
+
+  @property
+  def remaining(self):
+    '''Returns the number of seconds remaining until the time context (or an enclosing one)
+    will expire.
+    '''
+    return max(0.0,self._deadline - self._loop.time())
+
+  def check(self):
+    '''Raises TimerExpired if the context (or an enclosing one) has expired.'''
+    if self._expired or self._loop.time() >= self._deadline:
+      raise TimerExpired(self._loop.time() - self._start)
+
+  def __enter__(self):
+    if asyncio is None:
+      raise RuntimeError,"'timed_task' requires asyncio or trollius"
+    if self._start is not None:
+      raise RuntimeError,"cannot use the same 'timed_task' context more than once"
+    loop = self._loop = self._loop or asyncio.get_event_loop()
+    task = _current_task(loop)
+    if task is None:
+      raise RuntimeError,"cannot use the 'timed_task' context outside of a task"
+    self._task = task
+    _inherit_deadlines(loop)
+    contexts = _task_contexts.get(task)
+    if contexts is None:
+      _task_contexts[task] = contexts = []
+    self._start = loop.time()
+    deadline = self._start + self._interval
+    if contexts and contexts[-1]._deadline <= deadline:
+      self._deadline = contexts[-1]._deadline
+      # the enclosing context expires first. If it is this task's own, cancelling the task
+      # unwinds this one too; one inherited from another task only cancels that task.
+      if contexts[-1]._task is not task:
+        self._handle = loop.call_at(self._deadline,self._expire)
+    else:
+      self._deadline = deadline
+      self._handle = loop.call_at(deadline,self._expire)
+    contexts.append(self)
+    return self
+
+  def __exit__(self,exc_type,exc_value,tb):
+    self._stop = self._loop.time()
+    if self._handle is not None:
+      self._handle.cancel()
+      self._handle = None
+    _restore_task_factory(self._loop)
+    task,self._task = self._task,None
+    contexts = _task_contexts.get(task)
+    if contexts and contexts[-1] is self:
+      contexts.pop()
+    if not contexts:
+      _task_contexts.pop(task,None)
+    if self._expired:
+      raise TimerExpired(self._stop - self._start)
+
+  def _expire(self):
+    if self._stop is None:
+      self._expired = True
+      self._task.cancel()
+
+def timed_task(interval,loop=None):
+  return _TaskTimerContext(interval,loop)
+timed_task.__doc__ = _TaskTimerContext.__doc__
+
+def _innermost():
+  if _task_contexts:
+    task = _current_task()
+    contexts = task is not None and _task_contexts.get(task)
+    if contexts:
+      return contexts[-1]
+  contexts = getattr(_local,'contexts',None)
+  if contexts:
+    return contexts[-1]
+
+def check():
+  '''Raises TimerExpired if the innermost timer context of the calling task or, outside of
+  one, thread (or any context enclosing it) has expired. Does nothing outside a timer context.
+  This is cheap enough to call in tight loops.
+  '''
+  context = _innermost()
+  if context is not None:
+    context.check()
+
+def remaining():
+  '''Returns the number of seconds left before the innermost timer context of the calling task
+  or, outside of one, thread (or any context enclosing it) expires, None outside a timer context.
+  Code further down the call chain can use this to set its own timeouts, e.g. for I/O.
+  '''
+  context = _innermost()
+  if context is not None:
+    return context.remaining
+
 if __name__ == '__main__':
   print 'testing, should not run for longer than 0.5 seconds'
   try: